@@ -6,17 +6,27 @@ Documentation, License etc.
 
 import sys
 import os
-import ctypes
-import struct
-import re
-import itertools
 
 import structs
+from dump import (
+    DumpFile, DumpRange, iter_scan_cached, iter_scan_stream,
+    STRINGS, STRING_LIST_KEYS, DEFAULT_WINDOW_SIZE
+)
+from params import make_struct, make_strings, hidden_field
+from layouts import np
+from views import parse_filter, filter_mask, sort_order, apply_mask
+from names import NameIndex
+from search import search_index_cached
+from shops import ShopLineup, SHOP
 
 
 pyqt_version = 0
 skip_pyqt5 = "PYQT4" in os.environ
 filename = "DarkSoulsDump.m0000"
+# Read the dump in windows of this many MiB instead of mapping it
+stream_window = int(os.environ.get("STREAM_WINDOW_MB", 0)) << 20
+# Most hits of each kind listed per search
+SEARCH_LIMIT = 1000
 
 if not skip_pyqt5:
     try:
@@ -27,7 +37,7 @@ if not skip_pyqt5:
             QGridLayout, QHBoxLayout, QVBoxLayout,
             QAbstractItemView, QHeaderView,
             QListWidget, QListWidgetItem,
-            QTableWidget, QTableWidgetItem,
+            QTableWidget, QTableWidgetItem, QTableView,
             QTreeWidget, QTreeWidgetItem,
             QFrame, QScrollArea, QTabWidget,
             QStackedWidget, QWidget, QCheckBox, QComboBox,
@@ -53,7 +63,7 @@ if pyqt_version == 0:
             QGridLayout, QHBoxLayout, QVBoxLayout,
             QAbstractItemView, QHeaderView,
             QListWidget, QListWidgetItem,
-            QTableWidget, QTableWidgetItem,
+            QTableWidget, QTableWidgetItem, QTableView,
             QTreeWidget, QTreeWidgetItem,
             QFrame, QScrollArea, QTabWidget,
             QStackedWidget, QWidget, QCheckBox,
@@ -74,80 +84,6 @@ if pyqt_version == 0:
               "Make sure you installed the PyQt4 package.")
         sys.exit(-1)
 
-"""
-We use some magic numbers to find the string data.
-Horribly crude but it does the job.
-"""
-STRING_LIST_KEYS = {
-    b'\x60\x2F\x00': 'Goods Names',
-    b'\xF0\xD7\x06': 'Weapon Names',
-    b'\x24\x14\x01': 'Protector Names',
-    b'\xC8\x07\x00': 'Acc. Names',
-    b'\x2C\x10\x00': 'Magic Names',
-    b'\x2C\x07\x00': 'NPC Names',
-    b'\x5C\x08\x00': 'Game Area Names',
-    b'\xB4\x4B\x00': 'Tooltips',
-    b'\xC8\xAA\x00': 'Weapon Types',
-    b'\x14\x0B\x00': 'Acc. Tooltips',
-    b'\xEC\xAD\x01': 'Goods Desc.',
-    b'\x00\x4A\x09': 'Weapon Desc.',
-    b'\x88\x7E\x01': 'Protector Desc.',
-    b'\x6C\x48\x00': 'Acc. Desc.',
-    b'\x1C\x19\x00': 'Magic Tooltips',
-    b'\xB0\x7A\x00': 'Magic Desc.',          # Missing in old memdump
-    b'\xDC\xC8\x03': 'Subtitles',
-    b'\x60\x35\x00': 'Signs',
-    b'\xCC\x0B\x00': 'Intro Subs',
-    b'\x48\x6B\x00': 'UI Messages',
-    b'\xF4\x07\x00': 'UI Labels',
-    b'\xA0\x89\x00': 'Misc. Tooltips',       # Missing in old memdump
-    b'\x60\x56\x00': 'Character Creation',
-    b'\x80\x27\x00': 'UI Messages 2',
-    b'\x04\x47\x00': 'unk',
-    b'\x6C\x17\x00': 'UI Labels 2',
-    b'\xD4\x0C\x00': 'Moon',
-    b'\xE8\x02\x00': 'unk1',
-    b'\x10\x01\x00': 'unk2',                 # Missing in old memdump
-    b'\xC0\x49\x00': 'Main Menu',            # Missing in old memdump
-    b'\xEC\x48\x00': 'Goods Desc.',
-    b'\xA0\x1C\x00': 'Messages DLC',
-    b'\x84\x07\x00': 'unk3',                 # Missing in old memdump
-    b'\xD8\x04\x00': 'unk4',
-    b'\x24\x8E\x00': 'Subtitles DLC',
-    b'\xC0\x1B\x00': 'Magic Desc. DLC',
-    b'\xCC\x76\x00': 'Weapon Desc. DLC',
-    b'\x0C\x0A\x00': 'DLC Arena',
-    b'\x84\x2F\x00': 'Protector Desc. DLC',  # Missing in old memdump
-    b'\xCC\x03\x00': 'Acc. Desc. DLC',
-    b'\xF8\x04\x00': 'Goods Tooltips DLC',
-    b'\xA0\x03\x00': 'Goods Names DLC',
-    b'\x94\x00\x00': 'Acc. Tooltips DLC',
-    b'\x58\x00\x00': 'Acc. Names DLC',
-    b'\xC4\x12\x00': 'Weapon Types DLC',
-    b'\xC0\x39\x00': 'Weapon Names DLC',
-    #'unk5':        mks(b'\xD4\x01\x00', MAX_LEN=1024),  # Empty
-    b'\x78\x12\x00': 'Protector Names DLC',
-    b'\x18\x01\x00': 'Magic Names DLC',
-    b'\x2C\x01\x00': 'Boss Names DLC',
-    b'\x4C\x03\x00': 'Game Area Names DLC',
-    b'\x54\x07\x00': 'unk6',
-    b'\xA0\x07\x00': 'unk7',                 # Missing in old memdump
-    b'\x60\x07\x00': 'unk8',                 # Missing in old memdump
-}
-
-
-INT_TYPES = (
-    int,
-    ctypes.c_int8,
-    ctypes.c_int16,
-    ctypes.c_int32,
-    ctypes.c_int64,
-    ctypes.c_uint8,
-    ctypes.c_uint16,
-    ctypes.c_uint32,
-    ctypes.c_uint64,
-    )
-
 monofont = QFont()
 monofont.setStyleHint(QFont.Monospace)
 if not monofont.fixedPitch():
@@ -156,6 +92,75 @@ if not monofont.fixedPitch():
     monofont.setFamily("Monospace")
 
 
+class DumpLoader(QtCore.QThread):
+    """
+    Scan and parse the dump off the GUI thread, reporting each
+    string list and param table as soon as it's found
+    """
+    stringsFound = QtCore.pyqtSignal(str, object)
+    paramsFound = QtCore.pyqtSignal(str, object)
+    progress = QtCore.pyqtSignal(int)  # KiB into the dump
+
+    def __init__(self, dump, parent=None):
+        """
+        With no mapped dump, the dump file is streamed instead and
+        tables are only read in once they're used
+        """
+        super().__init__(parent)
+        self.dump = dump
+
+    def run(self):
+        interrupted = self.isInterruptionRequested
+        if self.dump:
+            hits = iter_scan_cached(self.dump, STRING_LIST_KEYS, structs.structs, interrupted=interrupted)
+        else:
+            hits = iter_scan_stream(filename, STRING_LIST_KEYS, structs.structs, stream_window or DEFAULT_WINDOW_SIZE,
+                                    interrupted=interrupted)
+        for hit in hits:
+            if interrupted():
+                break
+            if self.dump:
+                memory = self.dump.view[hit.offset:hit.end]
+            else:
+                memory = DumpRange(filename, hit.offset, hit.end)
+            if hit.kind == STRINGS:
+                self.stringsFound.emit(STRING_LIST_KEYS[hit.key], make_strings(memory)[0])
+            else:
+                key = str(hit.key, 'utf8').rstrip('\x00 ')
+                self.paramsFound.emit(key, make_struct(memory, structs.structs[hit.key])[0])
+            self.progress.emit(hit.end >> 10)
+
+
+class SearchIndexLoader(QtCore.QThread):
+    """
+    Load or build the search index off the GUI thread once everything has been found
+    """
+    indexReady = QtCore.pyqtSignal(object)
+
+    def __init__(self, dump, string_lists, param_lists, parent=None):
+        super().__init__(parent)
+        self.dump = dump
+        self.string_lists = string_lists
+        self.param_lists = param_lists
+
+    def run(self):
+        index = search_index_cached(self.dump, self.string_lists, self.param_lists, STRING_LIST_KEYS, structs.structs,
+                                    self.isInterruptionRequested)
+        if index is not None:
+            self.indexReady.emit(index)
+
+
+def insert_sorted(tree, item):
+    """
+    Add a top level tree item, keeping top level items in name order
+    """
+    name = item.text(0)
+    index = 0
+    while index < tree.topLevelItemCount() and tree.topLevelItem(index).text(0) < name:
+        index += 1
+    tree.insertTopLevelItem(index, item)
+
+
 class DarkSoulsParameterEditor(QMainWindow):
     """
     Main GUI class
@@ -164,94 +169,61 @@ class DarkSoulsParameterEditor(QMainWindow):
         QMainWindow.__init__(self, None)
         self.setWindowTitle("Dark Souls Parameter Editor")
 
-        file1 = open(filename, 'rb')
-        MEM = file1.read()
-        MEMv = memoryview(MEM)
-
-        strings_re = re.compile(b"\x00\x00\x01\x00(...)\x00\x01\x00\x00\x00")
-        string_lists = {}
-        i = 0
-        while i < len(MEMv)-16:
-            match = strings_re.search(MEMv[i:])
-            if not match:
-                break
-            print('Strings match at 0x{:07x}'.format(match.start()+i))
-            if match.group(1) in STRING_LIST_KEYS:
-                result = make_strings(MEMv[i+match.start():])
-                string_lists[STRING_LIST_KEYS[match.group(1)]] = result[0]
-                i += result[1] + match.start()
-                print(result[1])
-            else:
-                i += match.end() + 2
-        print('String matches done')
-
-        #weapon_names = {k: v for (k, o, v) in itertools.chain(string_lists['Weapon Names'], string_lists['Weapon Names DLC'])}
+        self.dump = None
+        if not stream_window:
+            try:
+                self.dump = DumpFile(filename)
+            except (OSError, ValueError, OverflowError, MemoryError) as e:
+                print("Couldn't map {} ({}), streaming it instead".format(filename, e))
+        self.string_lists = {}
+        self.param_lists = {}
+        self.param_items = {}
+        self.param_indexes = {}
+        self.string_items = {}
+        self.closing = False
+        # Weapon Names + Weapon Names DLC and the like, shared by every table view
+        self.names = NameIndex(self.string_lists)
 
         #weapons = make_struct(MEMv, 'EQUIP_PARAM_WEAPON_ST', structs.EQUIP_PARAM_WEAPON_ST)
-        param_lists = {}
-        params_re = re.compile(b'|'.join(structs.structs.keys()))
-        print(params_re)
-        i = 0
-        while i < len(MEMv)-64:
-            match = params_re.search(MEMv[i:])
-            if not match:
-                break
-            print('Structs match at 0x{:07x} - {}'.format(match.start()+i, match.group(0)))
-            result = make_struct(MEMv[i+match.start()-2:], structs.structs[match.group(0)])
-            key = str(match.group(0), 'utf8').rstrip('\x00 ')
-            if key in param_lists:
-                param_lists[key] += [result[0]]
-            else:
-                param_lists[key] = [result[0]]
-            i += match.start() + result[1] - 2
-            print(result[1])
-        print('Struct matches done')
-
-        str_headers = ['ID', 'Offset', 'String']
 
         self.tabwidget = QTabWidget()
-        structs_tab = TreeWidgetSingle()
-        strings_tab = TreeWidgetSingle()
-        editor_tab = TreeWidgetSingle()
-        self.tabwidget.addTab(structs_tab, "Structs")
-        self.tabwidget.addTab(strings_tab, "Strings")
-        #self.tabwidget.addTab(editor_tab, "Editors")
+        self.structs_tab = TreeWidgetSingle()
+        self.strings_tab = TreeWidgetSingle()
+        self.editor_tab = TreeWidgetSingle()
+        self.search_tab = QTreeWidget()
+        self.search_tab.setHeaderLabels(['Table', 'Row', 'Field', 'Value'])
+        self.search_tab.setRootIsDecorated(False)
+        self.tabwidget.addTab(self.structs_tab, "Structs")
+        self.tabwidget.addTab(self.strings_tab, "Strings")
+        self.tabwidget.addTab(self.search_tab, "Search")
+        self.tabwidget.addTab(self.editor_tab, "Editors")
 
         self.stackedwidget = QStackedWidget()
 
         def switch_widget(item, col):
-            if item:
+            if item and item.data(col, QtCore.Qt.UserRole) is not None:
                 self.stackedwidget.setCurrentIndex(item.data(col, QtCore.Qt.UserRole))
 
-        structs_tab.itemActivated.connect(switch_widget)
-        strings_tab.itemActivated.connect(switch_widget)
-        editor_tab.itemActivated.connect(switch_widget)
-
-        #structs_tab.addTab(make_param_table(weapons, IDs=weapon_names), "Weapons")
-        for name, lst in sorted(param_lists.items()):
-            if len(lst) > 1:
-                folder = QTreeWidgetItem([name])
-                structs_tab.addTopLevelItem(folder)
-                for i, sub in enumerate(lst):
-                    #index = self.stackedwidget.addWidget(make_param_table(sub))
-                    index = self.stackedwidget.addWidget(DeferredTable(sub))
-                    widget = QTreeWidgetItem([str(i)])
-                    widget.setData(0, QtCore.Qt.UserRole, index)
-                    folder.addChild(widget)
-            else:
-                #index = self.stackedwidget.addWidget(make_param_table(lst[0]))
-                index = self.stackedwidget.addWidget(DeferredTable(lst[0]))
-                widget = QTreeWidgetItem([name])
-                widget.setData(0, QtCore.Qt.UserRole, index)
-                structs_tab.addTopLevelItem(widget)
-        for name, lst in sorted(string_lists.items()):
-            index = self.stackedwidget.addWidget(make_table(str_headers, lst))
-            widget = QTreeWidgetItem([name])
-            widget.setData(0, QtCore.Qt.UserRole, index)
-            strings_tab.addTopLevelItem(widget)
+        self.structs_tab.itemActivated.connect(switch_widget)
+        self.strings_tab.itemActivated.connect(switch_widget)
+        self.editor_tab.itemActivated.connect(switch_widget)
+        self.search_tab.itemActivated.connect(self.show_search_hit)
+
+        self.search_index = None
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Building search index...")
+        self.search_box.setEnabled(False)
+        self.search_box.returnPressed.connect(self.search)
+
+        side_layout = QVBoxLayout()
+        side_layout.setContentsMargins(0, 0, 0, 0)
+        side_layout.addWidget(self.search_box)
+        side_layout.addWidget(self.tabwidget)
+        side_widget = QWidget()
+        side_widget.setLayout(side_layout)
 
         layout = QHBoxLayout()
-        layout.addWidget(self.tabwidget)
+        layout.addWidget(side_widget)
         layout.addWidget(self.stackedwidget)
         layout.setStretch(0, 0)
         layout.setStretch(1, 1)
@@ -259,56 +231,143 @@ class DarkSoulsParameterEditor(QMainWindow):
         self.main_widget.setLayout(layout)
         self.main_widget.setMinimumSize(800, 600)
         self.setCentralWidget(self.main_widget)
-        self.show()
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, os.path.getsize(filename) >> 10)
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.statusBar().showMessage('Scanning {}'.format(filename))
+
+        self.loader = DumpLoader(self.dump, self)
+        self.loader.stringsFound.connect(self.add_string_list)
+        self.loader.paramsFound.connect(self.add_param_table)
+        self.loader.progress.connect(self.progress_bar.setValue)
+        self.loader.finished.connect(self.loading_finished)
+        self.loader.start()
+        self.search_loader = SearchIndexLoader(self.dump, self.string_lists, self.param_lists, self)
+        self.search_loader.indexReady.connect(self.search_index_ready)
+        self.show()
 
-def make_struct(memory, struct_type):
-    """
-    Try same as weapon param structs
-    (u?)int16 holds number of entries
-    After that, "EQUIP_PARAM_WEAPON_ST" in UTF-8
-    14 bytes after null terminator, ID of first entry (uint32) followed by offset to struct (uint32) and 4 unk bytes (old name id?)
-    repeat 12 byte struct for all entries
-    """
-    idx = 2
-    num_structs = int.from_bytes(memory[idx-2:idx], 'little')
-    start = idx + 0x24
-    off_start = start + 12*num_structs
-    size = ctypes.sizeof(struct_type)
-    ids = []
-    for i in range(start, start+(12*num_structs), 12):
-        ids.append(struct.unpack('III', memory[i:i+12]))
-    params = []
-    end = off_start+(size*num_structs)
-    for i in range(off_start, end, size):
-        params.append(struct_type.from_buffer_copy(memory[i:i+size]))
-    return zip(ids, params), end
-
-
-def make_strings(memory, MAX_LEN=1024):
-    idx = 0  # Start of the memory passed is now the header
-    end_max = 16
-    num_blocks = int.from_bytes(memory[idx+12:idx+16], 'little')
-    IDs = []
-    start = idx + 28
-    off_start = start + 12 * num_blocks
-    for i in range(start, off_start, 12):
-        st_offset, st_ID, end_ID = struct.unpack('III', memory[i:i+12])
-        IDs += range(st_ID, end_ID+1)
-    str_offsets = []
-    for i in range(off_start, off_start+(len(IDs)*4), 4):
-        str_offsets.append(int.from_bytes(memory[i:i+4], 'little'))
-    strings = []
-    for off in str_offsets:
-        s = idx + off
-        end = s+2
-        for i in range(s, s+MAX_LEN*2, 2):
-            if int.from_bytes(memory[i:i+2], 'little') == 0:
-                end = i+2
-                break
-        strings.append(str(memory[s:end], 'utf_16_le'))
-        end_max = max(end, end_max)
-    return zip(IDs, str_offsets, strings), end_max
+    def add_param_table(self, name, table):
+        """
+        Add a param table to the Structs tree.
+        Tables sharing a name are grouped under a folder once there's more than one.
+        """
+        self.param_lists.setdefault(name, []).append(table)
+        #index = self.stackedwidget.addWidget(make_param_table(table))
+        index = self.stackedwidget.addWidget(DeferredTable(table, factory=self.make_named_table))
+        self.param_indexes.setdefault(name, []).append(index)
+        items = self.param_items.setdefault(name, [])
+        if not items:
+            widget = QTreeWidgetItem([name])
+            insert_sorted(self.structs_tab, widget)
+        else:
+            if len(items) == 1:
+                # Turn the single entry into a folder holding it as the first child
+                folder = items[0]
+                first = QTreeWidgetItem(['0'])
+                first.setData(0, QtCore.Qt.UserRole, folder.data(0, QtCore.Qt.UserRole))
+                folder.setData(0, QtCore.Qt.UserRole, None)
+                folder.addChild(first)
+            widget = QTreeWidgetItem([str(len(items))])
+            items[0].addChild(widget)
+        widget.setData(0, QtCore.Qt.UserRole, index)
+        items.append(widget)
+
+    def add_string_list(self, name, strings):
+        """
+        Add a string list to the Strings tree. A later list with the same name replaces the earlier one.
+        """
+        self.string_lists[name] = strings
+        self.names.list_changed(name)
+        current = self.stackedwidget.currentWidget()
+        if getattr(current, 'table', None) is not None:
+            # Repaint an open view whose Name column may have just changed
+            current.table.viewport().update()
+        index = self.stackedwidget.addWidget(DeferredTable(strings, factory=make_string_table))
+        if name not in self.string_items:
+            self.string_items[name] = QTreeWidgetItem([name])
+            insert_sorted(self.strings_tab, self.string_items[name])
+        self.string_items[name].setData(0, QtCore.Qt.UserRole, index)
+
+    def make_named_table(self, table):
+        """
+        make_param_table with a Name column for structs that have an item name list
+        """
+        return make_param_table(table, self.names.names_for(table.struct_type.__name__))
+
+    def make_shop_table(self, shop):
+        """
+        make_shop_table for a SHOP_LINEUP_PARAM table, joined with the tables and names loaded
+        """
+        return make_shop_table(ShopLineup(shop, self.param_lists, self.names))
+
+    def loading_finished(self):
+        if self.closing:
+            return
+        self.progress_bar.hide()
+        self.statusBar().showMessage('Found {} string lists and {} param tables'.format(
+            len(self.string_lists), sum(len(lst) for lst in self.param_lists.values())))
+        if SHOP in self.param_lists:
+            index = self.stackedwidget.addWidget(DeferredTable(self.param_lists[SHOP][0], factory=self.make_shop_table))
+            item = QTreeWidgetItem(["Shop Lineup"])
+            item.setData(0, QtCore.Qt.UserRole, index)
+            self.editor_tab.addTopLevelItem(item)
+        if self.dump is None:
+            # A streamed dump has no cached index, and building one reads every table in, so wait to be asked
+            self.search_box.setPlaceholderText("Press Enter to build the search index")
+            self.search_box.setEnabled(True)
+        else:
+            self.search_loader.start()
+
+    def search_index_ready(self, index):
+        self.search_index = index
+        self.search_box.setPlaceholderText("Search strings, or values as 2300 or 0..10")
+        self.search_box.setEnabled(True)
+        if self.search_box.text().strip():
+            # Typed while the index was being built on request
+            self.search()
+
+    def search(self):
+        """
+        Fill the Search tab with hits for the search box text,
+        or start building the index if it was left until asked for
+        """
+        if self.search_index is None:
+            self.search_box.setPlaceholderText("Building search index...")
+            self.search_box.setEnabled(False)
+            self.statusBar().showMessage('Building search index')
+            self.search_loader.start()
+            return
+        query = self.search_box.text().strip()
+        text_hits, value_hits = self.search_index.search(self.string_lists, query, SEARCH_LIMIT)
+        self.search_tab.clear()
+        for hit in text_hits:
+            item = QTreeWidgetItem([hit.list_name, str(hit.row), str(hit.ID), hit.string])
+            item.setData(0, QtCore.Qt.UserRole, (self.string_items[hit.list_name].data(0, QtCore.Qt.UserRole), hit.row))
+            self.search_tab.addTopLevelItem(item)
+        for hit in value_hits:
+            table = hit.struct_name if len(self.param_lists[hit.struct_name]) == 1 else '{} {}'.format(hit.struct_name, hit.table_no)
+            item = QTreeWidgetItem([table, str(hit.row), hit.field, '{:g}'.format(hit.value)])
+            item.setData(0, QtCore.Qt.UserRole, (self.param_indexes[hit.struct_name][hit.table_no], hit.row))
+            self.search_tab.addTopLevelItem(item)
+        self.tabwidget.setCurrentWidget(self.search_tab)
+        self.statusBar().showMessage('{} string and {} value hits for {!r}{}'.format(
+            len(text_hits), len(value_hits), query,
+            ' (first {} of each)'.format(SEARCH_LIMIT) if SEARCH_LIMIT in (len(text_hits), len(value_hits)) else ''))
+
+    def show_search_hit(self, item, col):
+        index, row = item.data(0, QtCore.Qt.UserRole)
+        self.stackedwidget.setCurrentIndex(index)
+        self.stackedwidget.widget(index).select_row(row)
+
+    def closeEvent(self, event):
+        # Loading may finish while waiting, after which its thread no longer reports the interruption
+        self.closing = True
+        self.loader.requestInterruption()
+        self.search_loader.requestInterruption()
+        self.loader.wait()
+        self.search_loader.wait()
+        super().closeEvent(event)
 
 
 def divceil(numerator, denominator):
@@ -320,126 +379,319 @@ def hex_length(i):
     return divceil(i.bit_length(), 4)
 
 
-def table_size_to_contents(table):
-    # Stupid hack to get table to size correctly
-    table.hide()
-    geometry = table.viewport().geometry()
-    table.viewport().setGeometry(QtCore.QRect(0, 0, 0x7FFFFFFF, 0x7FFFFFFF))
-    table.resizeColumnsToContents()
-    table.resizeRowsToContents()
-    table.viewport().setGeometry(geometry)
-    table.show()
-
-
-def make_table(headers, items, sortable=False, row_labels=True, scale=2):
-    """
-    Helper function to tabulate 2d lists
-    """
-    cols = len(headers)
-    if not isinstance(items, list):
-        items = list(items)
-    rows = len(items)
-    rd = hex_length(rows-1)
-    table = QTableWidget(rows, cols)
-    if row_labels:
-        table.setVerticalHeaderLabels(['0x{:0{}X}'.format(v, rd) for v in range(rows)])
-    else:
-        table.verticalHeader().setVisible(False)
-    table.setHorizontalHeaderLabels(headers)
-    for row, col, item in [(x, y, items[x][y]) for x in range(rows) for y in range(cols)]:
-        if isinstance(item, QPixmap):
-            lab = QLabel()
-            lab.setPixmap(item.scaled(item.size() * scale))
-            table.setCellWidget(row, col, lab)
-        elif item is not None:
-            if not isinstance(item, str):
-                item = str(item)
-            q_item = QTableWidgetItem(item)
-            if item[:2] == "0x":
-                q_item.setFont(monofont)
-            table.setItem(row, col, q_item)
-    table_size_to_contents(table)
-    if sortable:
-        table.setSortingEnabled(True)
-        table.sortItems(0)
-    return table
+"""
+Columns are sized from their header and an evenly spaced sample of rows, so
+sizing a table doesn't depend on how many rows it has. Rows are made tall enough
+for the most lines in any sampled cell, for multi-line text such as descriptions.
+Sizes for param tables are remembered per struct type.
+"""
+COLUMN_SAMPLE_ROWS = 64
+CELL_PADDING = 12
+table_sizes = {}
+text_widths = {}
+
+
+def text_width(metrics, text):
+    key = (metrics.height(), metrics.averageCharWidth(), text)
+    if key not in text_widths:
+        if hasattr(metrics, 'horizontalAdvance'):
+            text_widths[key] = metrics.horizontalAdvance(text)
+        else:
+            text_widths[key] = metrics.width(text)
+    return text_widths[key]
+
+
+def table_size_to_contents(table, cache_key=None, sample_rows=COLUMN_SAMPLE_ROWS):
+    if cache_key not in table_sizes:
+        model = table.model()
+        rows = model.rowCount()
+        sample = range(0, rows, max(1, rows // sample_rows))
+        metrics = table.fontMetrics()
+        header_metrics = table.horizontalHeader().fontMetrics()
+        widths = []
+        lines = 1
+        for col in range(model.columnCount()):
+            header = str(model.headerData(col, QtCore.Qt.Horizontal, QtCore.Qt.DisplayRole))
+            width = text_width(header_metrics, header)
+            for row in sample:
+                value = model.data(model.index(row, col), QtCore.Qt.DisplayRole)
+                if value is not None:
+                    value_lines = str(value).split('\n')
+                    lines = max(lines, len(value_lines))
+                    width = max(width, max(text_width(metrics, line) for line in value_lines))
+            widths.append(width + CELL_PADDING)
+        if cache_key is None:
+            return set_table_size(table, widths, lines)
+        table_sizes[cache_key] = widths, lines
+    set_table_size(table, *table_sizes[cache_key])
+
+
+def set_table_size(table, widths, lines=1):
+    for col, width in enumerate(widths):
+        table.setColumnWidth(col, width)
+    if lines > 1:
+        header = table.verticalHeader()
+        header.setDefaultSectionSize(header.defaultSectionSize() + (lines - 1) * table.fontMetrics().lineSpacing())
 
 
 class DeferredTable(QWidget):
     """
-    Generate a table only when shown
+    Generate a table only when shown.
+    Tables whose model can filter get a filter box above them.
     """
-    def __init__(self, *args):
+    def __init__(self, *args, factory=None):
         super().__init__()
+        self.factory = factory or make_param_table
         self.generate_args = args
+        self.table = None
 
     def make_table(self):
-        layout = QHBoxLayout()
+        layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
-        layout.addWidget(make_param_table(*self.generate_args))
+        self.table = self.factory(*self.generate_args)
+        if hasattr(self.table.model(), 'set_filter'):
+            self.filter_box = QLineEdit()
+            self.filter_box.setPlaceholderText("Filter, e.g. ID >= 1000 and sortId < 50")
+            self.filter_box.returnPressed.connect(self.apply_filter)
+            layout.addWidget(self.filter_box)
+        layout.addWidget(self.table)
         self.setLayout(layout)
         self.generate_args = False
 
+    def apply_filter(self):
+        try:
+            self.table.model().set_filter(self.filter_box.text())
+        except ValueError as e:
+            self.filter_box.setToolTip(str(e))
+            self.filter_box.setStyleSheet("QLineEdit { color: red; }")
+        else:
+            self.filter_box.setToolTip('')
+            self.filter_box.setStyleSheet('')
+
     def showEvent(self, event):
         super().showEvent(event)
         if self.generate_args:
             self.make_table()
 
+    def select_row(self, source_row):
+        """
+        Scroll to and select a row, by its position in the dump rather than in the view
+        """
+        if self.generate_args:
+            self.make_table()
+        model = self.table.model()
+        view_row = model.view_row(source_row) if hasattr(model, 'view_row') else source_row
+        if view_row is None:
+            # Filtered out, so drop the filter
+            self.filter_box.clear()
+            self.apply_filter()
+            view_row = model.view_row(source_row)
+        self.table.selectRow(view_row)
+        self.table.scrollTo(model.index(view_row, 0), QAbstractItemView.PositionAtCenter)
+
+
+class OrderedTableModel(QtCore.QAbstractTableModel):
+    """
+    Read-only model whose rows can be sorted and filtered a whole column at a time.
+    Sorting and filtering leave a permutation of source rows in self.order, which
+    the view rows map through. Subclasses give a cell with value() and a whole
+    column with column(), both by row in the source rather than in the view.
+    """
+    def __init__(self, headers, num_rows, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.header_cols = {header: col for col, header in enumerate(self.headers)}
+        self.row_digits = hex_length(num_rows-1)
+        self.sorted_order = np.arange(num_rows) if np is not None else list(range(num_rows))
+        self.mask = None
+        self.order = self.sorted_order
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.headers[section]
+        return '0x{:0{}X}'.format(int(self.order[section]), self.row_digits)
+
+    def column_by_name(self, name):
+        return self.column(self.header_cols[name])
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        return self.value(int(self.order[index.row()]), index.column())
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self.sorted_order = sort_order(self.column(column), order == QtCore.Qt.DescendingOrder)
+        self.order = apply_mask(self.sorted_order, self.mask)
+        self.layoutChanged.emit()
+
+    def set_filter(self, text):
+        """
+        Show only rows matching a views.parse_filter() filter, raising ValueError for bad filters
+        """
+        mask = filter_mask(self.column_by_name, parse_filter(text))
+        self.beginResetModel()
+        self.mask = mask
+        self.order = apply_mask(self.sorted_order, self.mask)
+        self.endResetModel()
+
+    def view_row(self, source_row):
+        """
+        View row showing a source row, or None if it's filtered out
+        """
+        if np is not None:
+            rows = np.flatnonzero(self.order == source_row)
+            return int(rows[0]) if len(rows) else None
+        return self.order.index(source_row) if source_row in self.order else None
+
+
+class ParamTableModel(OrderedTableModel):
+    """
+    Model over a ParamTable.
+    Cells are read from the table's rows, and whole columns are only built to sort
+    or filter on. Padding and reserved fields aren't shown at all.
+    """
+    ID_HEADERS = ['ID', 'ST Offset', 'OldNameOffset']
+
+    def __init__(self, table, IDs=None, parent=None):
+        self.table = table
+        self.IDs = IDs
+        self.fields = [f[0] for f in table.struct_type._fields_ if not hidden_field(f[0])]
+        super().__init__(self.ID_HEADERS + (['Name'] if IDs is not None else []) + self.fields, len(table), parent)
+        self.reserved_cols = len(self.headers) - len(self.fields)
+
+    def value(self, source_row, col):
+        """
+        Python value of a cell, by row in the dump rather than in the view
+        """
+        if col < len(self.ID_HEADERS):
+            return self.table.header(source_row)[col]
+        if col < self.reserved_cols:
+            return str(self.IDs.get(self.table.ids[source_row], ''))
+        value = getattr(self.table.row(source_row), self.fields[col-self.reserved_cols])
+        if not isinstance(value, (int, float)):
+            return str(list(value))
+        return value
+
+    def column(self, col):
+        """
+        Every source row's value of a view column, as an array where NumPy is available
+        """
+        if col < len(self.ID_HEADERS):
+            values = self.table.header_columns()[col]
+        elif col < self.reserved_cols:
+            values = [str(self.IDs.get(ID, '')) for ID in self.table.ids]
+        else:
+            return self.table.column(self.fields[col-self.reserved_cols])
+        return np.asarray(values) if np is not None else values
+
+
+def make_param_table(items, IDs=None, sortable=True, row_labels=True):
+    """
+    Virtual view of a ParamTable, optionally with a Name column looked up from IDs
+    """
+    model = ParamTableModel(items, IDs)
+    table = QTableView()
+    table.setModel(model)
+    model.setParent(table)
+    if not row_labels:
+        table.verticalHeader().setVisible(False)
+    table_size_to_contents(table, (items.struct_type, IDs is not None))
+    if sortable:
+        table.setSortingEnabled(True)
+        table.sortByColumn(0, QtCore.Qt.AscendingOrder)
+    return table
+
 
-def make_param_table(items, IDs=None, sortable=True, row_labels=True, scale=2):
+class ShopLineupModel(OrderedTableModel):
     """
-    Helper function to tabulate 2d lists
+    Model over a ShopLineup.
+    Every cell was worked out when the join was built, so painting is a lookup.
     """
-    if not isinstance(items, list):
-        items = list(items)
-    fields = [f[0] for f in items[0][1]._fields_]
-    id_header = ['ID', 'ST Offset', 'OldNameOffset']
-    if IDs:
-        id_header.append('Name')
-    headers = id_header + fields
-    reserved_cols = len(id_header)
-    cols = len(headers)
-    rows = len(items)
-    rd = hex_length(rows-1)
-    table = QTableWidget(rows, cols)
-    if row_labels:
-        table.setVerticalHeaderLabels(['0x{:0{}X}'.format(v, rd) for v in range(rows)])
-    else:
+    def __init__(self, lineup, parent=None):
+        self.lineup = lineup
+        super().__init__(lineup.HEADERS, len(lineup), parent)
+
+    def value(self, source_row, col):
+        value = self.lineup.column(self.headers[col])[source_row]
+        return value.item() if np is not None else value
+
+    def column(self, col):
+        return self.lineup.column(self.headers[col])
+
+
+def make_shop_table(lineup, sortable=True, row_labels=True):
+    """
+    Virtual view of a ShopLineup
+    """
+    model = ShopLineupModel(lineup)
+    table = QTableView()
+    table.setModel(model)
+    model.setParent(table)
+    if not row_labels:
         table.verticalHeader().setVisible(False)
-    table.setHorizontalHeaderLabels(headers)
-    for i, title in enumerate(headers):
-        if title[:3] == 'pad' or title[:7] == 'reserve':
-            table.setColumnHidden(i, True)
-    for row, item in enumerate(items):
-        for col, val in enumerate(item[0]):
-            q_item = QTableWidgetItem()
-            q_item.setData(QtCore.Qt.DisplayRole, val)
-            table.setItem(row, col, q_item)
-        if IDs:
-            table.setItem(row, 3, QTableWidgetItem(str(IDs.get(item[0][0], ''))))
-        for col, value in [(i+reserved_cols, getattr(item[1], fields[i])) for i in range(len(fields))]:
-            if isinstance(value, QPixmap):
-                lab = QLabel()
-                lab.setPixmap(value.scaled(value.size() * scale))
-                table.setCellWidget(row, col, lab)
-            elif isinstance(value, (float, ctypes.c_float)):
-                #q_item = QTableWidgetItem("{0:.2f}".format(value))
-                q_item = QTableWidgetItem()
-                q_item.setData(QtCore.Qt.DisplayRole, float(value))
-                table.setItem(row, col, q_item)
-            elif isinstance(value, INT_TYPES):
-                q_item = QTableWidgetItem()
-                q_item.setData(QtCore.Qt.DisplayRole, int(value))
-                table.setItem(row, col, q_item)
-            elif value is not None:
-                q_item = QTableWidgetItem(str(value))
-                #if item[:2] == "0x":
-                    #q_item.setFont(monofont)
-                table.setItem(row, col, q_item)
-    table_size_to_contents(table)
+    table_size_to_contents(table, ShopLineup)
     if sortable:
         table.setSortingEnabled(True)
-        table.sortItems(0)
+        table.sortByColumn(0, QtCore.Qt.AscendingOrder)
+    return table
+
+
+class StringListModel(QtCore.QAbstractTableModel):
+    """
+    Read-only model over a StringList.
+    Strings are decoded only when a row is painted.
+    """
+    HEADERS = ['ID', 'Offset', 'String']
+
+    def __init__(self, strings, parent=None):
+        super().__init__(parent)
+        self.strings = strings
+        self.row_digits = hex_length(len(strings)-1)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.strings)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.HEADERS[section]
+        return '0x{:0{}X}'.format(section, self.row_digits)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        if col == 0:
+            return self.strings.ids[row]
+        if col == 1:
+            return self.strings.offsets[row]
+        return self.strings.string(row)
+
+
+def make_string_table(strings, row_labels=True):
+    """
+    Virtual view of a StringList
+    """
+    model = StringListModel(strings)
+    table = QTableView()
+    table.setModel(model)
+    model.setParent(table)
+    if not row_labels:
+        table.verticalHeader().setVisible(False)
+    table_size_to_contents(table)
     return table
 
 
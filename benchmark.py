@@ -0,0 +1,107 @@
+'''
+Rough timings for dump loading, run against a real dump:
+    python benchmark.py [DarkSoulsDump.m0000]
+
+@package DarkSoulsParameterEditor
+'''
+
+import sys
+import re
+import time
+import struct
+
+import structs
+from dump import DumpFile, scan_dump, scan_dump_parallel, hit_extent, STRINGS, PARAMS, STRING_LIST_KEYS
+from params import make_strings
+
+
+def legacy_scan(memory, string_keys, struct_types):
+    """
+    The original two-pass search loops, re-slicing the dump after every match
+    """
+    hits = []
+    strings_re = re.compile(b"\x00\x00\x01\x00(...)\x00\x01\x00\x00\x00")
+    i = 0
+    while i < len(memory)-16:
+        match = strings_re.search(memory[i:])
+        if not match:
+            break
+        if match.group(1) in string_keys:
+            offset = i + match.start()
+            end = hit_extent(memory, STRINGS, offset, match.group(1), struct_types)
+            hits.append((offset, STRINGS))
+            i = end
+        else:
+            i += match.end() + 2
+    params_re = re.compile(b'|'.join(struct_types.keys()))
+    i = 0
+    while i < len(memory)-64:
+        match = params_re.search(memory[i:])
+        if not match:
+            break
+        offset = i + match.start() - 2
+        hits.append((offset, PARAMS))
+        i = hit_extent(memory, PARAMS, offset, match.group(0), struct_types)
+    return sorted(hits)
+
+
+def legacy_make_strings(memory, MAX_LEN=1024):
+    """
+    The original string parser, checking for a terminator two bytes at a time
+    """
+    idx = 0
+    end_max = 16
+    num_blocks = int.from_bytes(memory[idx+12:idx+16], 'little')
+    IDs = []
+    start = idx + 28
+    off_start = start + 12 * num_blocks
+    for i in range(start, off_start, 12):
+        st_offset, st_ID, end_ID = struct.unpack('III', memory[i:i+12])
+        IDs += range(st_ID, end_ID+1)
+    str_offsets = []
+    for i in range(off_start, off_start+(len(IDs)*4), 4):
+        str_offsets.append(int.from_bytes(memory[i:i+4], 'little'))
+    strings = []
+    for off in str_offsets:
+        s = idx + off
+        end = s+2
+        for i in range(s, s+MAX_LEN*2, 2):
+            if int.from_bytes(memory[i:i+2], 'little') == 0:
+                end = i+2
+                break
+        strings.append(str(memory[s:end], 'utf_16_le'))
+        end_max = max(end, end_max)
+    return list(zip(IDs, str_offsets, strings)), end_max
+
+
+def decode_all_strings(memory):
+    return list(make_strings(memory)[0])
+
+
+def timed(label, func, *args):
+    t = time.perf_counter()
+    result = func(*args)
+    print('{:<24} {:8.3f}s'.format(label, time.perf_counter() - t))
+    return result
+
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'DarkSoulsDump.m0000'
+    with DumpFile(filename) as dumpfile:
+        memory = dumpfile.view
+        print('{}: {} MiB'.format(filename, len(memory) >> 20))
+        legacy = timed('legacy two-pass scan', legacy_scan, memory, STRING_LIST_KEYS, structs.structs)
+        hits = timed('single-pass scan', scan_dump, memory, STRING_LIST_KEYS, structs.structs)
+        same = legacy == [(hit.offset, hit.kind) for hit in hits]
+        print('{} hits, {} legacy, identical: {}'.format(len(hits), len(legacy), same))
+        parallel = timed('parallel scan', scan_dump_parallel, dumpfile, STRING_LIST_KEYS, structs.structs)
+        print('parallel identical: {}'.format(parallel == hits))
+        string_hits = sorted((hit for hit in hits if hit.kind == STRINGS), key=lambda hit: hit.offset - hit.end)
+        for hit in string_hits[:3]:
+            print('{} ({} KiB):'.format(STRING_LIST_KEYS[hit.key], (hit.end - hit.offset) >> 10))
+            timed('  legacy make_strings', legacy_make_strings, memory[hit.offset:hit.end])
+            timed('  lazy make_strings', make_strings, memory[hit.offset:hit.end])
+            timed('  decode every string', decode_all_strings, memory[hit.offset:hit.end])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,502 @@
+'''
+Memory dump access
+
+@package DarkSoulsParameterEditor
+'''
+
+import os
+import collections
+import concurrent.futures
+import ctypes
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import multiprocessing
+import re
+
+
+class DumpFile:
+    """
+    Memory-mapped view of a memory dump.
+    Pages are faulted in by the OS on demand rather than copied into the heap,
+    and several editor instances looking at the same dump share the page cache.
+    The mapping is copy-on-write so ctypes from_buffer() views work without
+    ever touching the file on disk.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except Exception:
+            self.file.close()
+            raise
+        self.view = memoryview(self.mmap)
+
+    def __len__(self):
+        return len(self.mmap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Unmap the dump. Any views handed out must have been released first.
+        """
+        self.view.release()
+        self.mmap.close()
+        self.file.close()
+
+
+"""
+We use some magic numbers to find the string data.
+Horribly crude but it does the job.
+"""
+STRING_LIST_KEYS = {
+    b'\x60\x2F\x00': 'Goods Names',
+    b'\xF0\xD7\x06': 'Weapon Names',
+    b'\x24\x14\x01': 'Protector Names',
+    b'\xC8\x07\x00': 'Acc. Names',
+    b'\x2C\x10\x00': 'Magic Names',
+    b'\x2C\x07\x00': 'NPC Names',
+    b'\x5C\x08\x00': 'Game Area Names',
+    b'\xB4\x4B\x00': 'Tooltips',
+    b'\xC8\xAA\x00': 'Weapon Types',
+    b'\x14\x0B\x00': 'Acc. Tooltips',
+    b'\xEC\xAD\x01': 'Goods Desc.',
+    b'\x00\x4A\x09': 'Weapon Desc.',
+    b'\x88\x7E\x01': 'Protector Desc.',
+    b'\x6C\x48\x00': 'Acc. Desc.',
+    b'\x1C\x19\x00': 'Magic Tooltips',
+    b'\xB0\x7A\x00': 'Magic Desc.',          # Missing in old memdump
+    b'\xDC\xC8\x03': 'Subtitles',
+    b'\x60\x35\x00': 'Signs',
+    b'\xCC\x0B\x00': 'Intro Subs',
+    b'\x48\x6B\x00': 'UI Messages',
+    b'\xF4\x07\x00': 'UI Labels',
+    b'\xA0\x89\x00': 'Misc. Tooltips',       # Missing in old memdump
+    b'\x60\x56\x00': 'Character Creation',
+    b'\x80\x27\x00': 'UI Messages 2',
+    b'\x04\x47\x00': 'unk',
+    b'\x6C\x17\x00': 'UI Labels 2',
+    b'\xD4\x0C\x00': 'Moon',
+    b'\xE8\x02\x00': 'unk1',
+    b'\x10\x01\x00': 'unk2',                 # Missing in old memdump
+    b'\xC0\x49\x00': 'Main Menu',            # Missing in old memdump
+    b'\xEC\x48\x00': 'Goods Desc.',
+    b'\xA0\x1C\x00': 'Messages DLC',
+    b'\x84\x07\x00': 'unk3',                 # Missing in old memdump
+    b'\xD8\x04\x00': 'unk4',
+    b'\x24\x8E\x00': 'Subtitles DLC',
+    b'\xC0\x1B\x00': 'Magic Desc. DLC',
+    b'\xCC\x76\x00': 'Weapon Desc. DLC',
+    b'\x0C\x0A\x00': 'DLC Arena',
+    b'\x84\x2F\x00': 'Protector Desc. DLC',  # Missing in old memdump
+    b'\xCC\x03\x00': 'Acc. Desc. DLC',
+    b'\xF8\x04\x00': 'Goods Tooltips DLC',
+    b'\xA0\x03\x00': 'Goods Names DLC',
+    b'\x94\x00\x00': 'Acc. Tooltips DLC',
+    b'\x58\x00\x00': 'Acc. Names DLC',
+    b'\xC4\x12\x00': 'Weapon Types DLC',
+    b'\xC0\x39\x00': 'Weapon Names DLC',
+    #'unk5':        mks(b'\xD4\x01\x00', MAX_LEN=1024),  # Empty
+    b'\x78\x12\x00': 'Protector Names DLC',
+    b'\x18\x01\x00': 'Magic Names DLC',
+    b'\x2C\x01\x00': 'Boss Names DLC',
+    b'\x4C\x03\x00': 'Game Area Names DLC',
+    b'\x54\x07\x00': 'unk6',
+    b'\xA0\x07\x00': 'unk7',                 # Missing in old memdump
+    b'\x60\x07\x00': 'unk8',                 # Missing in old memdump
+}
+
+
+"""
+FMG string lists start with a 12 byte header whose bytes 4-6 are the size of
+the list, which doubles as the key identifying it.
+Param tables are found by their space-padded struct name, which sits 2 bytes
+after the uint16 row count. Every name ends in a null and some run of spaces,
+so we search for the shortest such terminator and check the name in front of it,
+which is far cheaper than running an alternation of every name over the dump.
+"""
+STRINGS = 'strings'
+PARAMS = 'params'
+STRINGS_RE = re.compile(b'\x00\x00\x01\x00(...)\x00\x01\x00\x00\x00', re.DOTALL)
+STRINGS_SIGNATURE_SIZE = 12
+PARAM_HEADER_SIZE = 0x26
+PARAM_ENTRY_SIZE = 12
+
+ScanHit = collections.namedtuple('ScanHit', ['offset', 'end', 'kind', 'key'])
+
+
+def hit_extent(memory, kind, offset, key, struct_types):
+    """
+    End offset of the string list or param table starting at offset, or None if it runs off the dump
+    """
+    if kind == STRINGS:
+        end = offset + int.from_bytes(memory[offset+4:offset+8], 'little')
+    else:
+        if offset < 0:
+            return None
+        num_structs = int.from_bytes(memory[offset:offset+2], 'little')
+        size = ctypes.sizeof(struct_types[key])
+        end = offset + PARAM_HEADER_SIZE + (PARAM_ENTRY_SIZE + size) * num_structs
+    if end > len(memory):
+        return None
+    return end
+
+
+def iter_string_matches(memory, pos, endpos):
+    for match in STRINGS_RE.finditer(memory, pos, endpos):
+        yield match.start(), STRINGS, match.group(1)
+
+
+def iter_param_matches(memory, struct_types, pos, endpos):
+    name_lengths = sorted({(key.index(b'\x00'), len(key)) for key in struct_types})
+    padding = min(key_len - name_len for name_len, key_len in name_lengths)
+    terminator_re = re.compile(re.escape(b'\x00' + b' '*(padding-1)))
+    for match in terminator_re.finditer(memory, pos, endpos):
+        null = match.start()
+        for name_len, key_len in name_lengths:
+            start = null - name_len
+            if start < 2:
+                continue
+            key = bytes(memory[start:start+key_len])
+            if key in struct_types:
+                # Param tables start at the row count preceding the name
+                yield start - 2, PARAMS, key
+                break
+
+
+def iter_matches(memory, struct_types, pos=0, endpos=None):
+    """
+    Raw (offset, kind, key) candidates for both kinds, merged into a single forward stream.
+    Each pattern is swept once with finditer, never re-slicing the dump.
+    """
+    if endpos is None:
+        endpos = len(memory)
+    return heapq.merge(
+        iter_string_matches(memory, pos, endpos),
+        iter_param_matches(memory, struct_types, pos, endpos))
+
+
+def iter_hits(memory, matches, string_keys, struct_types):
+    """
+    Filter raw candidates into hits, skipping anything inside an already found list/table.
+    Strings and params are tracked separately so neither hides the other.
+    """
+    skip_to = {STRINGS: 0, PARAMS: 0}
+    for offset, kind, key in matches:
+        if offset < skip_to[kind]:
+            continue
+        if kind == STRINGS and key not in string_keys:
+            continue
+        end = hit_extent(memory, kind, offset, key, struct_types)
+        if end is None:
+            continue
+        yield ScanHit(offset, end, kind, key)
+        skip_to[kind] = end
+
+
+def resolve_hits(memory, matches, string_keys, struct_types):
+    return list(iter_hits(memory, matches, string_keys, struct_types))
+
+
+def scan_dump(memory, string_keys, struct_types):
+    """
+    Find all known FMG string lists and param tables in one pass.
+    Returns a list of ScanHits sorted by offset.
+    """
+    return resolve_hits(memory, iter_matches(memory, struct_types), string_keys, struct_types)
+
+
+"""
+Parallel scanning splits the dump into chunks searched by worker processes,
+each of which maps the dump itself so they all share the page cache.
+Every chunk is searched a little past its end so signatures straddling a
+boundary are still found, and a hit belongs to the chunk its offset falls in.
+"""
+MIN_CHUNK_SIZE = 1 << 22
+
+
+def never():
+    """
+    Default for the interrupted() callbacks of long scans, which are polled to stop early
+    """
+    return False
+
+
+def pool_context():
+    """
+    Start method for scan workers that doesn't fork the calling process, which may be running other threads
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+_worker_dump = None
+
+
+def _attach_worker(filename):
+    global _worker_dump
+    _worker_dump = DumpFile(filename)
+
+
+def _scan_chunk(param_keys, overlap, start, end):
+    memory = _worker_dump.view
+    endpos = min(end + overlap, len(memory))
+    return [match for match in iter_matches(memory, param_keys, start, endpos) if start <= match[0] < end]
+
+
+def scan_dump_parallel(dumpfile, string_keys, struct_types, workers=None, chunk_size=None):
+    """
+    Same result as scan_dump, with the raw search spread across a process pool
+    """
+    return list(iter_scan_parallel(dumpfile, string_keys, struct_types, workers, chunk_size))
+
+
+def iter_scan_parallel(dumpfile, string_keys, struct_types, workers=None, chunk_size=None, interrupted=never):
+    """
+    Hits in order as the chunks containing them finish, stopping early once interrupted() is true
+    """
+    memory = dumpfile.view
+    length = len(dumpfile)
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(MIN_CHUNK_SIZE, -(-length // (workers * 4)))
+    if workers == 1 or length <= chunk_size:
+        matches = itertools.takewhile(lambda match: not interrupted(), iter_matches(memory, struct_types))
+        yield from iter_hits(memory, matches, string_keys, struct_types)
+        return
+    param_keys = frozenset(struct_types)
+    # Longest signature is a padded struct name plus the row count in front of it
+    overlap = max(STRINGS_SIGNATURE_SIZE, 2 + max(len(key) for key in param_keys))
+    starts = range(0, length, chunk_size)
+    ends = [min(start + chunk_size, length) for start in starts]
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=pool_context(), initializer=_attach_worker,
+                                                initargs=(dumpfile.filename,)) as pool:
+        futures = [pool.submit(_scan_chunk, param_keys, overlap, start, end) for start, end in zip(starts, ends)]
+
+        def matches():
+            # Chunks own disjoint ranges and are taken in order, so their matches can be resolved as they arrive
+            try:
+                for future in futures:
+                    if interrupted():
+                        return
+                    yield from future.result()
+            finally:
+                # Don't wait for chunks nobody will read
+                for future in futures:
+                    future.cancel()
+
+        yield from iter_hits(memory, matches(), string_keys, struct_types)
+
+
+"""
+Scan results are cached in a sidecar file next to the dump, keyed by its size,
+mtime and a hash of a few samples spread through it. Each cached hit is also
+checked against the dump before use, so stale or mismatched caches are
+rebuilt rather than trusted. A cache can't show that a hit is missing, though,
+so SCAN_INDEX_VERSION goes up whenever the scanner finds hits it used to miss.
+"""
+SCAN_INDEX_VERSION = 2
+SCAN_INDEX_SUFFIX = '.scanidx'
+FINGERPRINT_SAMPLES = 64
+FINGERPRINT_SAMPLE_SIZE = 4096
+
+
+def dump_fingerprint(dumpfile):
+    stat = os.stat(dumpfile.filename)
+    memory = dumpfile.view
+    length = len(memory)
+    digest = hashlib.blake2b(digest_size=16)
+    step = max(length // FINGERPRINT_SAMPLES, 1)
+    for offset in itertools.chain(range(0, length, step), [max(length - FINGERPRINT_SAMPLE_SIZE, 0)]):
+        digest.update(memory[offset:offset+FINGERPRINT_SAMPLE_SIZE])
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest.hexdigest()}
+
+
+def keys_fingerprint(string_keys, struct_types):
+    digest = hashlib.blake2b(digest_size=16)
+    for key in itertools.chain(sorted(string_keys), sorted(struct_types)):
+        digest.update(key)
+    return digest.hexdigest()
+
+
+def hit_rows(memory, hit):
+    """
+    Number of strings or param rows in a hit, read from its header
+    """
+    if hit.kind == STRINGS:
+        return int.from_bytes(memory[hit.offset+16:hit.offset+20], 'little')
+    return int.from_bytes(memory[hit.offset:hit.offset+2], 'little')
+
+
+def hit_is_valid(memory, hit, string_keys, struct_types):
+    if hit.kind == STRINGS:
+        match = STRINGS_RE.match(memory, hit.offset)
+        valid = match and match.group(1) == hit.key and hit.key in string_keys
+    else:
+        start = hit.offset + 2
+        valid = hit.key in struct_types and memory[start:start+len(hit.key)] == hit.key
+    return bool(valid) and hit_extent(memory, hit.kind, hit.offset, hit.key, struct_types) == hit.end
+
+
+def load_scan_index(dumpfile, string_keys, struct_types):
+    """
+    Cached hits for this dump, or None if there is no usable cache
+    """
+    try:
+        with open(dumpfile.filename + SCAN_INDEX_SUFFIX, 'r') as file:
+            index = json.load(file)
+        if (index['version'] != SCAN_INDEX_VERSION
+                or index['keys'] != keys_fingerprint(string_keys, struct_types)
+                or index['dump'] != dump_fingerprint(dumpfile)):
+            return None
+        hits = [ScanHit(h['offset'], h['end'], h['kind'], bytes.fromhex(h['key'])) for h in index['hits']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    memory = dumpfile.view
+    for hit, cached in zip(hits, index['hits']):
+        if not hit_is_valid(memory, hit, string_keys, struct_types) or hit_rows(memory, hit) != cached['rows']:
+            return None
+    return hits
+
+
+def save_scan_index(dumpfile, hits, string_keys, struct_types):
+    memory = dumpfile.view
+    index = {
+        'version': SCAN_INDEX_VERSION,
+        'keys': keys_fingerprint(string_keys, struct_types),
+        'dump': dump_fingerprint(dumpfile),
+        'hits': [{'offset': hit.offset, 'end': hit.end, 'kind': hit.kind, 'key': hit.key.hex(),
+                  'rows': hit_rows(memory, hit)} for hit in hits],
+        }
+    path = dumpfile.filename + SCAN_INDEX_SUFFIX
+    try:
+        with open(path + '.tmp', 'w') as file:
+            json.dump(index, file, indent=1)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print("Couldn't write scan index {}: {}".format(path, e))
+
+
+def scan_dump_cached(dumpfile, string_keys, struct_types, scan=scan_dump_parallel):
+    """
+    Hits from the sidecar scan index if it matches the dump, otherwise scan and rewrite it.
+    Returns (hits, cached).
+    """
+    hits = load_scan_index(dumpfile, string_keys, struct_types)
+    if hits is not None:
+        return hits, True
+    hits = scan(dumpfile, string_keys, struct_types)
+    save_scan_index(dumpfile, hits, string_keys, struct_types)
+    return hits, False
+
+
+def iter_scan_cached(dumpfile, string_keys, struct_types, scan=iter_scan_parallel, interrupted=never):
+    """
+    Like scan_dump_cached, but yields hits as they are found when there's no usable index.
+    An interrupted scan stops early and isn't cached.
+    """
+    hits = load_scan_index(dumpfile, string_keys, struct_types)
+    if hits is not None:
+        yield from hits
+        return
+    hits = []
+    for hit in scan(dumpfile, string_keys, struct_types, interrupted=interrupted):
+        hits.append(hit)
+        yield hit
+    if not interrupted():
+        save_scan_index(dumpfile, hits, string_keys, struct_types)
+
+
+"""
+Streaming mode is for dumps too large to map. The dump is read in fixed-size
+windows, each extended by the longest signature so nothing straddling a
+boundary is missed, and a hit belongs to the window its offset falls in.
+Found lists and tables are returned as DumpRanges, which are only read from
+disk once opened, so peak memory during the scan is bounded by the window size.
+"""
+DEFAULT_WINDOW_SIZE = 64 << 20
+
+
+class DumpRange:
+    """
+    Byte range of a dump file, read into memory the first time it's needed
+    """
+    def __init__(self, filename, offset, end):
+        self.filename = filename
+        self.offset = offset
+        self.end = end
+        self.view = None
+
+    def __len__(self):
+        return self.end - self.offset
+
+    def load(self):
+        if self.view is None:
+            buffer = bytearray(len(self))
+            with open(self.filename, 'rb') as file:
+                file.seek(self.offset)
+                file.readinto(buffer)
+            self.view = memoryview(buffer)
+        return self.view
+
+    def release(self):
+        """
+        Forget the bytes read, so they can be freed once nothing else holds them
+        """
+        self.view = None
+
+
+class DumpStream:
+    """
+    Sequential windows over a dump file.
+    Slicing takes absolute dump offsets, which must lie in the current window.
+    """
+    def __init__(self, file, window_size, overlap):
+        self.file = file
+        self.length = os.fstat(file.fileno()).st_size
+        self.window_size = window_size
+        self.overlap = overlap
+        self.start = 0
+        self.buffer = memoryview(b'')
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.buffer[index.start-self.start:index.stop-self.start]
+
+    def windows(self):
+        buffer = bytearray(self.window_size + self.overlap)
+        for start in range(0, self.length, self.window_size):
+            self.file.seek(start)
+            self.start = start
+            self.buffer = memoryview(buffer)[:self.file.readinto(buffer)]
+            yield start, self.buffer
+
+
+def iter_scan_stream(filename, string_keys, struct_types, window_size=DEFAULT_WINDOW_SIZE, interrupted=never):
+    """
+    Hits in order, scanning the dump a window at a time instead of mapping it,
+    stopping early once interrupted() is true
+    """
+    overlap = max(STRINGS_SIGNATURE_SIZE, 2 + max(len(key) for key in struct_types))
+    with open(filename, 'rb') as file:
+        stream = DumpStream(file, window_size, overlap)
+
+        def matches():
+            for start, window in stream.windows():
+                if interrupted():
+                    return
+                for offset, kind, key in iter_matches(window, struct_types):
+                    if offset < window_size:
+                        yield start + offset, kind, key
+
+        yield from iter_hits(stream, matches(), string_keys, struct_types)
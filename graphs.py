@@ -0,0 +1,353 @@
+'''
+Reference graphs between param rows, for questions spanning several tables
+
+@package DarkSoulsParameterEditor
+'''
+
+from array import array
+
+from params import UINT32
+from references import field_column, SP_EFFECT, NPC, NPC_THINK, BEHAVIOR, ATK, BULLET
+
+
+class ReferenceGraph:
+    """
+    Directed graph over param rows, held as compact arrays.
+    Rows are (struct name, table number, row index), numbered in self.nodes, and the
+    edges out of node n are targets[offsets[n]:offsets[n+1]]; edges into it are held
+    the same way in sources/reverse_offsets.
+    When a row changes its new edges go in an overlay rather than rebuilding the arrays.
+    Closures are memoised, with strongly connected components sharing one closure, and
+    only the changed node and the nodes reaching it are forgotten on a change.
+    """
+    def __init__(self, nodes, edges):
+        """
+        nodes is every row in the graph and edges (source row, target row) pairs between them
+        """
+        self.nodes = list(nodes)
+        self.node_numbers = {node: n for n, node in enumerate(self.nodes)}
+        numbered = sorted(set((self.node_numbers[source], self.node_numbers[target]) for source, target in edges))
+        self.offsets, self.targets = self.compact(numbered)
+        self.reverse_offsets, self.sources = self.compact(sorted((target, source) for source, target in numbered))
+        self.changed = {}
+        self.changed_sources = {}
+        self.closures = {}
+        self.cycles = {}
+
+    def compact(self, pairs):
+        """
+        (offsets, targets) arrays for (node, target) pairs sorted by node
+        """
+        offsets = array(UINT32, [0] * (len(self.nodes) + 1))
+        targets = array(UINT32, (target for node, target in pairs))
+        for node, target in pairs:
+            offsets[node + 1] += 1
+        for n in range(len(self.nodes)):
+            offsets[n + 1] += offsets[n]
+        return offsets, targets
+
+    def number(self, node):
+        """
+        Number of a row, adding it to the graph if it isn't there yet
+        """
+        if node not in self.node_numbers:
+            self.node_numbers[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self.node_numbers[node]
+
+    def successors(self, n):
+        if n in self.changed:
+            return self.changed[n]
+        if n + 1 < len(self.offsets):
+            return self.targets[self.offsets[n]:self.offsets[n+1]]
+        return ()
+
+    def predecessors(self, n):
+        """
+        Nodes with an edge to n, possibly including some whose edges have since changed
+        """
+        sources = set(self.changed_sources.get(n, ()))
+        if n + 1 < len(self.reverse_offsets):
+            sources.update(self.sources[self.reverse_offsets[n]:self.reverse_offsets[n+1]])
+        return sources
+
+    def closure_numbers(self, start):
+        """
+        Node numbers reachable from node number start, found by an iterative Tarjan
+        walk that settles whole strongly connected components at a time
+        """
+        if start in self.closures:
+            return self.closures[start]
+        index, lowlink, stack, on_stack = {}, {}, [], set()
+        work = [(start, iter(self.successors(start)))]
+        index[start] = lowlink[start] = 0
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            n, successors = work[-1]
+            for successor in successors:
+                if successor in self.closures:
+                    continue
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(self.successors(successor))))
+                    break
+                if successor in on_stack:
+                    lowlink[n] = min(lowlink[n], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[n])
+                if lowlink[n] == index[n]:
+                    self.settle(n, stack, on_stack)
+        return self.closures[start]
+
+    def settle(self, root, stack, on_stack):
+        """
+        Pop the strongly connected component rooted at root and give all its members their closure
+        """
+        members = []
+        while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            members.append(member)
+            if member == root:
+                break
+        reachable = set()
+        for member in members:
+            for successor in self.successors(member):
+                reachable.add(successor)
+                reachable.update(self.closures.get(successor, ()))
+        closure = frozenset(reachable)
+        cyclic = len(members) > 1 or root in reachable
+        for member in members:
+            self.closures[member] = closure
+            if cyclic:
+                self.cycles[member] = tuple(members)
+
+    def closure(self, node):
+        """
+        Every row reachable from a row
+        """
+        if node not in self.node_numbers:
+            return set()
+        return {self.nodes[n] for n in self.closure_numbers(self.node_numbers[node])}
+
+    def ancestors(self, node):
+        """
+        Every row that can reach a row
+        """
+        if node not in self.node_numbers:
+            return set()
+        found = set()
+        pending = [self.node_numbers[node]]
+        while pending:
+            n = pending.pop()
+            for source in self.predecessors(n):
+                # Skip sources whose edge to n has since been changed away
+                if source not in found and n in self.successors(source):
+                    found.add(source)
+                    pending.append(source)
+        return {self.nodes[n] for n in found}
+
+    def find_cycles(self):
+        """
+        Every cycle in the graph, as the tuple of rows in each strongly connected component
+        """
+        for n in range(len(self.nodes)):
+            self.closure_numbers(n)
+        return sorted({tuple(sorted(self.nodes[m] for m in members)) for members in self.cycles.values()})
+
+    def set_edges(self, node, targets):
+        """
+        Replace the edges out of a row and forget the closures that could have changed
+        """
+        n = self.number(node)
+        numbers = array(UINT32, sorted({self.number(target) for target in targets}))
+        self.changed[n] = numbers
+        for target in numbers:
+            self.changed_sources.setdefault(target, set()).add(n)
+        stale = {n}
+        pending = [n]
+        while pending:
+            for source in self.predecessors(pending.pop()):
+                if source not in stale:
+                    stale.add(source)
+                    pending.append(source)
+        # Every member of a cycle through n reaches n, so whole components go stale together
+        for stale_node in stale:
+            self.closures.pop(stale_node, None)
+            self.cycles.pop(stale_node, None)
+
+
+def reference_edges(references, target_names, source_names=None):
+    """
+    (source row, target row) for every resolved reference into the given structs,
+    optionally only from the given structs
+    """
+    for source_row, targets in references.forward.items():
+        if source_names is not None and source_row[0] not in source_names:
+            continue
+        for field, target_row in targets:
+            if target_row[0] in target_names:
+                yield source_row, target_row
+
+
+class SpEffectGraph:
+    """
+    SP effects reachable from any row: effects referenced by weapons, protectors, goods,
+    NPCs and so on, and the effects those effects go on to apply.
+    Built from a ReferenceIndex, which row_changed() keeps up to date as well.
+    """
+    def __init__(self, references):
+        self.references = references
+        edges = list(reference_edges(references, {SP_EFFECT}))
+        nodes = {row for edge in edges for row in edge}
+        self.graph = ReferenceGraph(sorted(nodes), edges)
+
+    def effects(self, name, table_no, row):
+        """
+        Every SP effect row ultimately applied by a row, as (struct name, table number, row index)
+        """
+        return self.graph.closure((name, table_no, row))
+
+    def effect_ids(self, name, table_no, row):
+        """
+        Sorted IDs of every SP effect ultimately applied by a row
+        """
+        tables = self.references.param_lists[SP_EFFECT]
+        effects = self.effects(name, table_no, row)
+        return sorted(tables[effect_table].ids[effect_row] for _, effect_table, effect_row in effects)
+
+    def cycles(self):
+        return self.graph.find_cycles()
+
+    def row_changed(self, name, table_no, row):
+        """
+        Re-read an edited row's references and forget only the closures it affects
+        """
+        self.references.row_changed(name, table_no, row)
+        source_row = (name, table_no, row)
+        targets = [target_row for field, target_row in self.references.references(*source_row)
+                   if target_row[0] == SP_EFFECT]
+        self.graph.set_edges(source_row, targets)
+
+
+"""
+An NPC's behaviours aren't referenced by ID: NPC_PARAM_ST.behaviorVariationId
+selects every BEHAVIOR_PARAM_ST row with that variationId. Everything else in
+the chain NPC -> think -> behaviour -> attack/bullet -> attack/child bullet is
+an ordinary foreign key.
+The dump holds NPC and PC tables of both BEHAVIOR_PARAM_ST and ATK_PARAM_ST.
+Unless the ReferenceIndex's target_tables pins an NPC table to a behaviour table,
+variations match behaviours in every table, as IDs match rows in every table.
+"""
+NPC_CHAIN = (NPC, NPC_THINK, BEHAVIOR, ATK, BULLET)
+
+
+class NpcGraph:
+    """
+    Dependency graph from NPCs through their think, behaviour, attack and bullet rows.
+    Built from a ReferenceIndex plus the behaviour variations, which row_changed() keeps
+    up to date as well. Subtrees are memoised by the underlying ReferenceGraph.
+    """
+    def __init__(self, references):
+        self.references = references
+        self.npc_variations = {}
+        self.behavior_variations = {}
+        for name, variations, field in ((NPC, self.npc_variations, 'behaviorVariationId'),
+                                        (BEHAVIOR, self.behavior_variations, 'variationId')):
+            for table_no, table in enumerate(references.param_lists.get(name, [])):
+                for row, variation in enumerate(field_column(table, field)):
+                    variations.setdefault(variation, set()).add((name, table_no, row))
+        edges = list(reference_edges(references, set(NPC_CHAIN), set(NPC_CHAIN)))
+        for variation, npcs in self.npc_variations.items():
+            edges.extend((npc, behavior) for npc in npcs for behavior in self.behaviors(npc, variation))
+        nodes = {row for edge in edges for row in edge}
+        self.graph = ReferenceGraph(sorted(nodes), edges)
+
+    def edges_from(self, source_row):
+        """
+        Rows a chain row depends on directly
+        """
+        targets = [target_row for field, target_row in self.references.references(*source_row)
+                   if target_row[0] in NPC_CHAIN]
+        if source_row[0] == NPC:
+            targets.extend(self.behaviors(source_row))
+        return targets
+
+    def behaviors(self, npc_row, variation=None):
+        """
+        Behaviour rows of an NPC row's variation, from the behaviour table pinned to its table if there is one
+        """
+        if variation is None:
+            variation = self.variation(npc_row)
+        behaviors = self.behavior_variations.get(variation, ())
+        table_no = self.references.target_tables.get((NPC, npc_row[1], BEHAVIOR))
+        if table_no is None:
+            return behaviors
+        return {behavior for behavior in behaviors if behavior[1] == table_no}
+
+    def ambiguous_behaviors(self):
+        """
+        {NPC row: behaviour table numbers} for NPC rows whose variation matches behaviours in more than one table.
+        Ambiguous ID references along the chain are in the ReferenceIndex's ambiguous.
+        """
+        ambiguous = {}
+        for variation, npcs in self.npc_variations.items():
+            for npc in npcs:
+                table_nos = sorted({behavior[1] for behavior in self.behaviors(npc, variation)})
+                if len(table_nos) > 1:
+                    ambiguous[npc] = table_nos
+        return ambiguous
+
+    def variation(self, row):
+        name, table_no, row_no = row
+        field = 'behaviorVariationId' if name == NPC else 'variationId'
+        return getattr(self.references.param_lists[name][table_no].row(row_no), field)
+
+    def subtree(self, name, table_no, row):
+        """
+        Every think, behaviour, attack and bullet row a row depends on, as (struct name, table number, row index)
+        """
+        return self.graph.closure((name, table_no, row))
+
+    def subtree_ids(self, name, table_no, row):
+        """
+        {struct name: sorted IDs} of a row's subtree
+        """
+        ids = {}
+        for target_name, target_table, target_row in self.subtree(name, table_no, row):
+            ids.setdefault(target_name, []).append(self.references.param_lists[target_name][target_table].ids[target_row])
+        return {target_name: sorted(target_ids) for target_name, target_ids in ids.items()}
+
+    def affected_npcs(self, name, table_no, row):
+        """
+        NPC rows whose subtree includes a row, e.g. every enemy using an ATK_PARAM_ST row
+        """
+        return {source for source in self.graph.ancestors((name, table_no, row)) if source[0] == NPC}
+
+    def row_changed(self, name, table_no, row):
+        """
+        Re-read an edited row's references, and for NPCs and behaviours their variations,
+        forgetting only the subtrees that could have changed
+        """
+        self.references.row_changed(name, table_no, row)
+        changed_row = (name, table_no, row)
+        sources = [changed_row]
+        if name in (NPC, BEHAVIOR):
+            variations = self.npc_variations if name == NPC else self.behavior_variations
+            for members in variations.values():
+                members.discard(changed_row)
+            variations.setdefault(self.variation(changed_row), set()).add(changed_row)
+            if name == BEHAVIOR:
+                # NPCs of the old and new variation may have lost or gained this behaviour
+                graph = self.graph
+                old_npcs = {graph.nodes[n] for n in graph.predecessors(graph.number(changed_row))
+                            if graph.nodes[n][0] == NPC}
+                sources += sorted(old_npcs | self.npc_variations.get(self.variation(changed_row), set()))
+        for source_row in sources:
+            self.graph.set_edges(source_row, self.edges_from(source_row))
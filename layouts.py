@@ -0,0 +1,140 @@
+'''
+NumPy views of the ctypes structs
+
+@package DarkSoulsParameterEditor
+'''
+
+import collections
+import ctypes
+import functools
+
+from dump import PARAM_HEADER_SIZE, PARAM_ENTRY_SIZE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+"""
+Bitfield members can't be expressed in a NumPy dtype, so each storage unit
+holding bitfields becomes a plain integer field named after its byte offset,
+and the members are recorded as (storage field, shift, mask) to pick them out.
+"""
+BitfieldLayout = collections.namedtuple('BitfieldLayout', ['name', 'ctype', 'byte_offset', 'bit_offset', 'width'])
+BitfieldMask = collections.namedtuple('BitfieldMask', ['storage', 'shift', 'mask'])
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for vectorised table access. "
+                          "Make sure you installed the numpy package.")
+
+
+def bitfield_bits(descriptor):
+    """
+    (bit offset, bit width) of a ctypes bitfield descriptor
+    """
+    if hasattr(descriptor, 'bit_size'):  # Python 3.13+
+        return descriptor.bit_offset, descriptor.bit_size
+    return descriptor.size & 0xFFFF, descriptor.size >> 16
+
+
+def storage_name(offset):
+    return '_bits_0x{:X}'.format(offset)
+
+
+@functools.lru_cache(maxsize=None)
+def bitfield_layouts(struct_type):
+    """
+    Layout of every bitfield member of struct_type, by field name, in declaration order
+    """
+    layouts = {}
+    for name, ctype, *bits in struct_type._fields_:
+        if bits:
+            descriptor = getattr(struct_type, name)
+            bit_offset, width = bitfield_bits(descriptor)
+            layouts[name] = BitfieldLayout(name, ctype, descriptor.offset, bit_offset, width)
+    return layouts
+
+
+@functools.lru_cache(maxsize=None)
+def struct_dtype(struct_type):
+    """
+    Little-endian structured dtype equivalent to struct_type, and its bitfield masks by field name
+    """
+    require_numpy()
+    names, formats, offsets = [], [], []
+    bitfields = {}
+    layouts = bitfield_layouts(struct_type)
+    for name, ctype, *bits in struct_type._fields_:
+        descriptor = getattr(struct_type, name)
+        if bits:
+            layout = layouts[name]
+            storage = storage_name(layout.byte_offset)
+            if storage not in names:
+                names.append(storage)
+                formats.append(np.dtype(ctype).newbyteorder('<'))
+                offsets.append(layout.byte_offset)
+            bitfields[name] = BitfieldMask(storage, layout.bit_offset, (1 << layout.width) - 1)
+        else:
+            names.append(name)
+            formats.append(np.dtype(ctype).newbyteorder('<'))
+            offsets.append(descriptor.offset)
+    dtype = np.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                      'itemsize': ctypes.sizeof(struct_type)})
+    return dtype, bitfields
+
+
+def param_array(memory, struct_type):
+    """
+    Zero-copy structured array over the rows of the param table whose header starts at memory[0]
+    """
+    dtype = struct_dtype(struct_type)[0]
+    num_structs = int.from_bytes(memory[0:2], 'little')
+    off_start = PARAM_HEADER_SIZE + PARAM_ENTRY_SIZE*num_structs
+    return np.frombuffer(memory, dtype, count=num_structs, offset=off_start)
+
+
+def field_values(array, struct_type, name):
+    """
+    Values of one field for every row, unpacking bitfields
+    """
+    if name in struct_dtype(struct_type)[1]:
+        return decode_bitfield(array, struct_type, name)
+    return array[name]
+
+
+def decode_bitfield(array, struct_type, name):
+    """
+    One bitfield member for every row of a param_array at once
+    """
+    storage, shift, mask = struct_dtype(struct_type)[1][name]
+    return (array[storage] >> shift) & mask
+
+
+def decode_bitfields(array, struct_type):
+    """
+    Every bitfield member for every row, reading each storage unit only once
+    """
+    bitfields = struct_dtype(struct_type)[1]
+    units = {}
+    values = {}
+    for name, (storage, shift, mask) in bitfields.items():
+        if storage not in units:
+            units[storage] = np.asarray(array[storage])
+        values[name] = (units[storage] >> shift) & mask
+    return values
+
+
+def encode_bitfield(array, struct_type, name, values, rows=slice(None)):
+    """
+    Write one bitfield member for the selected rows of a param_array in place.
+    values is broadcast against the selection and truncated to the field width.
+    """
+    storage, shift, mask = struct_dtype(struct_type)[1][name]
+    column = array[storage]
+    unit_type = column.dtype.type
+    values = np.asarray(values).astype(unit_type) & unit_type(mask)
+    cleared = column[rows] & unit_type(~(mask << shift) & np.iinfo(unit_type).max)
+    column[rows] = cleared | (values << unit_type(shift))
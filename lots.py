@@ -0,0 +1,174 @@
+'''
+Drop probabilities of the items in ITEMLOT_PARAM_ST lots
+
+@package DarkSoulsParameterEditor
+'''
+
+from layouts import np
+
+LOT_SLOTS = 8
+
+
+def slot_fields(prefix):
+    return ['{}{:02}'.format(prefix, slot) for slot in range(1, LOT_SLOTS+1)]
+
+
+ITEM_ID_FIELDS = slot_fields('lotItemId')
+CATEGORY_FIELDS = slot_fields('lotItemCategory')
+POINT_FIELDS = slot_fields('lotItemBasePoint')
+
+"""
+Each lot row rolls one of its eight slots, weighted by lotItemBasePoint, so a
+slot's chance is its points over the row's total. Slots with no item (ID 0 or
+less) are the chance of nothing dropping. A lot also rolls every row following
+it with consecutive IDs, each independently, so an item's chance from a lot
+is 1 - product(1 - chance in each row of the chain).
+Luck and cumulative lot points aren't accounted for.
+Items are (lotItemCategory, lotItemId) pairs.
+"""
+
+
+def row_chances(row):
+    """
+    {item: chance} for one ITEMLOT_PARAM_ST row on its own
+    """
+    points = [getattr(row, field) for field in POINT_FIELDS]
+    total = sum(points)
+    chances = {}
+    if not total:
+        return chances
+    for item_id, category, point in zip((getattr(row, field) for field in ITEM_ID_FIELDS),
+                                        (getattr(row, field) for field in CATEGORY_FIELDS), points):
+        if item_id > 0 and point:
+            item = (category, item_id)
+            chances[item] = chances.get(item, 0) + point / total
+    return chances
+
+
+def combine_chances(chances):
+    """
+    {item: chance of at least one} for independent rolls, each a {item: chance}
+    """
+    misses = {}
+    for roll in chances:
+        for item, chance in roll.items():
+            misses[item] = misses.get(item, 1.0) * (1 - chance)
+    return {item: 1 - miss for item, miss in misses.items()}
+
+
+class LotProbabilities:
+    """
+    Effective drop chance of every item in every lot of an ITEMLOT_PARAM_ST ParamTable,
+    and the inverse index from items to the lots dropping them.
+    Everything is worked out for the whole table at once, with NumPy where available;
+    after a row is edited, row_changed() redoes only the lots whose chains include it.
+    Lots are identified by row internally and by lot ID in queries.
+    """
+    def __init__(self, table):
+        self.table = table
+        if np is not None:
+            self.row_items, self.lot_items = self.compute_numpy()
+        else:
+            self.row_items = [row_chances(table.row(row)) for row in range(len(table))]
+            self.lot_items = [self.chain_chances(row) for row in range(len(table))]
+        self.item_lots = {}
+        for row, items in enumerate(self.lot_items):
+            for item, chance in items.items():
+                self.item_lots.setdefault(item, {})[row] = chance
+
+    def chain(self, row):
+        """
+        Rows rolled for the lot in a row: it and the rows with the IDs following it
+        """
+        rows = [row]
+        while True:
+            following = self.table.row_for_id(self.table.ids[rows[-1]] + 1)
+            if following is None:
+                return rows
+            rows.append(following)
+
+    def chain_chances(self, row):
+        return combine_chances(self.row_items[chained] for chained in self.chain(row))
+
+    def compute_numpy(self):
+        """
+        (chances per row, chances per lot) for every row, as lists of {item: chance}
+        """
+        table = self.table
+        num_rows = len(table)
+        item_ids = np.stack([table.column(field) for field in ITEM_ID_FIELDS], 1).astype(np.int64)
+        categories = np.stack([table.column(field) for field in CATEGORY_FIELDS], 1).astype(np.int64)
+        points = np.stack([table.column(field) for field in POINT_FIELDS], 1).astype(np.float64)
+        totals = points.sum(1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slot_chances = np.where(totals > 0, points / totals, 0)
+
+        # One entry per item per row, summing slots holding the same item
+        rows, slots = np.nonzero((item_ids > 0) & (slot_chances > 0))
+        keys = (categories[rows, slots] << 32) | item_ids[rows, slots]
+        pairs, inverse = np.unique(np.stack([rows, keys], 1), axis=0, return_inverse=True)
+        entry_chances = np.bincount(inverse.ravel(), weights=slot_chances[rows, slots], minlength=len(pairs))
+        entry_rows, entry_keys = (pairs[:, 0], pairs[:, 1]) if len(pairs) else (rows, keys)
+        starts = np.searchsorted(entry_rows, np.arange(num_rows))
+        counts = np.searchsorted(entry_rows, np.arange(num_rows), 'right') - starts
+
+        # Walk every chain a step at a time, gathering each row's entries under the lot it's chained to
+        next_rows = table.rows_for_ids(np.asarray(table.ids, dtype=np.int64) + 1)
+        lots = current = np.arange(num_rows)
+        lot_parts, entry_parts = [], []
+        while len(current):
+            entry_counts = counts[current]
+            first = np.repeat(starts[current] - (np.cumsum(entry_counts) - entry_counts), entry_counts)
+            entry_parts.append(first + np.arange(entry_counts.sum()))
+            lot_parts.append(np.repeat(lots, entry_counts))
+            chained = next_rows[current] >= 0
+            lots, current = lots[chained], next_rows[current][chained]
+        chain_lots = np.concatenate(lot_parts)
+        chain_entries = np.concatenate(entry_parts)
+        pairs, inverse = np.unique(np.stack([chain_lots, entry_keys[chain_entries]], 1), axis=0, return_inverse=True)
+        with np.errstate(divide='ignore'):
+            log_misses = np.bincount(inverse.ravel(), weights=np.log1p(-entry_chances[chain_entries]), minlength=len(pairs))
+        lot_chances = -np.expm1(log_misses)
+
+        def by_row(rows, keys, chances):
+            items = [{} for row in range(num_rows)]
+            for row, key, chance in zip(rows.tolist(), keys.tolist(), chances.tolist()):
+                items[row][key >> 32, key & 0xFFFFFFFF] = chance
+            return items
+        return (by_row(entry_rows, entry_keys, entry_chances),
+                by_row(pairs[:, 0], pairs[:, 1], lot_chances) if len(pairs) else [{} for row in range(num_rows)])
+
+    def row_changed(self, row):
+        """
+        Redo the chances for an edited row and every lot whose chain reaches it
+        """
+        self.table.invalidate()
+        self.row_items[row] = row_chances(self.table.row(row))
+        lots = [row]
+        while True:
+            previous = self.table.row_for_id(self.table.ids[lots[-1]] - 1)
+            if previous is None:
+                break
+            lots.append(previous)
+        for lot in lots:
+            for item in self.lot_items[lot]:
+                del self.item_lots[item][lot]
+                if not self.item_lots[item]:
+                    del self.item_lots[item]
+            self.lot_items[lot] = self.chain_chances(lot)
+            for item, chance in self.lot_items[lot].items():
+                self.item_lots.setdefault(item, {})[lot] = chance
+
+    def lot(self, lot_id):
+        """
+        {item: chance} for a lot ID, chained rows included
+        """
+        row = self.table.row_for_id(lot_id)
+        return {} if row is None else self.lot_items[row]
+
+    def drops(self, category, item_id):
+        """
+        [(lot ID, chance)] of every lot that can drop an item, most likely first
+        """
+        lots = self.item_lots.get((category, item_id), {})
+        return sorted(((self.table.ids[row], chance) for row, chance in lots.items()), key=lambda lot: -lot[1])
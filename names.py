@@ -0,0 +1,101 @@
+'''
+Item names joined across the base game and DLC string lists
+
+@package DarkSoulsParameterEditor
+'''
+
+from references import WEAPON, PROTECTOR, ACCESSORY, GOODS, MAGIC
+
+
+"""
+Base string lists that have a DLC counterpart of the same name with ' DLC' appended.
+"""
+JOINED_LISTS = ['Goods Names', 'Protector Names', 'Acc. Names', 'Magic Names', 'Weapon Names', 'Game Area Names']
+DLC_SUFFIX = ' DLC'
+
+"""
+Param structs whose row IDs are item IDs in one of the joined lists.
+"""
+STRUCT_NAMES = {
+    GOODS: 'Goods Names',
+    PROTECTOR: 'Protector Names',
+    ACCESSORY: 'Acc. Names',
+    MAGIC: 'Magic Names',
+    WEAPON: 'Weapon Names',
+    'GAME_AREA_PARAM_ST': 'Game Area Names',
+    }
+
+
+def id_names(strings):
+    """
+    {ID: string} for a StringList, leaving out IDs with no string
+    """
+    offsets = strings.offsets
+    return {ID: strings.string(i) for i, ID in enumerate(strings.ids) if offsets[i]}
+
+
+class NameIndex:
+    """
+    {ID: name} per joined list, each merged from the base list and its DLC list on first use.
+    Where both lists name an ID the DLC name wins, as the game patches it over the base one.
+    string_lists maps list names to StringLists, as the editor holds them.
+    The dicts handed out are shared and kept up to date, so every table view sees the same one.
+    """
+    def __init__(self, string_lists, joined_lists=JOINED_LISTS):
+        self.string_lists = string_lists
+        self.joined_lists = joined_lists
+        self.joined = {}
+
+    def names(self, list_name):
+        """
+        Joined {ID: name} for a base list name, or None if neither list has been loaded
+        """
+        if list_name not in self.joined:
+            if not any(name in self.string_lists for name in (list_name, list_name + DLC_SUFFIX)):
+                return None
+            self.joined[list_name] = {}
+            self.fill(list_name)
+        return self.joined[list_name]
+
+    def fill(self, list_name):
+        """
+        Refill a join from the current lists, in place so views already holding the dict see the change
+        """
+        joined = self.joined[list_name]
+        joined.clear()
+        for name in (list_name, list_name + DLC_SUFFIX):
+            if name in self.string_lists:
+                joined.update(id_names(self.string_lists[name]))
+
+    def names_for(self, struct_name):
+        """
+        Joined {ID: name} for the rows of a param struct, or None if it has no names
+        """
+        if struct_name not in STRUCT_NAMES:
+            return None
+        return self.names(STRUCT_NAMES[struct_name])
+
+    def name(self, struct_name, param_id, default=''):
+        names = self.names_for(struct_name)
+        if names is None:
+            return default
+        return names.get(param_id, default)
+
+    def list_changed(self, list_name):
+        """
+        Rebuild the join a base or DLC list belongs to, if it has been built, after the list was added or replaced
+        """
+        if list_name.endswith(DLC_SUFFIX):
+            list_name = list_name[:-len(DLC_SUFFIX)]
+        if list_name in self.joined:
+            self.fill(list_name)
+
+    def search(self, text):
+        """
+        (base list name, ID, name) for every loaded name containing text, ignoring case
+        """
+        text = text.casefold()
+        for list_name in self.joined_lists:
+            for ID, name in sorted((self.names(list_name) or {}).items()):
+                if text in name.casefold():
+                    yield list_name, ID, name
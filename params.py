@@ -0,0 +1,371 @@
+'''
+Param tables and string lists in a dump
+
+@package DarkSoulsParameterEditor
+'''
+
+import sys
+import re
+import bisect
+import ctypes
+import itertools
+import struct
+from array import array
+
+from dump import DumpRange, PARAM_HEADER_SIZE, PARAM_ENTRY_SIZE
+from layouts import np, param_array, field_values, bitfield_layouts
+
+UINT32 = 'I' if array('I').itemsize == 4 else 'L'
+INT32 = 'i' if array('i').itemsize == 4 else 'l'
+# array module typecodes for the ctypes scalar types used in the structs
+ARRAY_TYPECODES = {'b': 'b', 'B': 'B', 'h': 'h', 'H': 'H', 'i': INT32, 'I': UINT32, 'f': 'f'}
+FMG_HEADER_SIZE = 28
+FMG_BLOCK_SIZE = 12
+
+
+def uint32_columns(memory, count, width):
+    """
+    Split count records of width little-endian uint32s into width typed columns, in bulk
+    """
+    words = array(UINT32)
+    words.frombytes(memory[:4*count*width])
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return tuple(words[i::width] for i in range(width))
+
+
+def hidden_field(name):
+    """
+    Padding and reserved space, which views hide and columns are never built for
+    """
+    return name[:3] == 'pad' or name[:7] == 'reserve'
+
+
+class ParamTable:
+    """
+    Lazy view of one param table in a dump.
+    Only the header is read up front; rows are ctypes from_buffer() views
+    decoded as they are accessed, so the table can be iterated any number of times.
+    Items are (ID header, row) pairs, the ID header being (ID, ST offset, old name offset).
+    The ID headers are held as three parallel uint32 columns.
+    Fields can also be read a whole column at a time; each column is built the
+    first time it's asked for and kept until invalidate() is called.
+    memory may also be a DumpRange, in which case nothing is read until the table is used,
+    and release() lets go of what was read.
+    """
+    def __init__(self, memory, struct_type):
+        self.source = memory
+        self.range = memory if isinstance(memory, DumpRange) else None
+        self.struct_type = struct_type
+        self.stride = ctypes.sizeof(struct_type)
+        if isinstance(memory, DumpRange):
+            self.num_structs = (len(memory) - PARAM_HEADER_SIZE) // (PARAM_ENTRY_SIZE + self.stride)
+        else:
+            self.num_structs = int.from_bytes(memory[0:2], 'little')
+        self.entries_start = PARAM_HEADER_SIZE
+        self.rows_start = self.entries_start + PARAM_ENTRY_SIZE*self.num_structs
+        self.end = self.rows_start + self.stride*self.num_structs
+        self.columns = None
+        self.field_columns = {}
+        self.id_rows = None
+        self.sorted_ids = None
+        self.sorted_rows = None
+
+    @property
+    def memory(self):
+        source = self.source
+        if isinstance(source, DumpRange):
+            source = self.source = source.load()
+        return source
+
+    @property
+    def loaded(self):
+        return not isinstance(self.source, DumpRange)
+
+    def header_columns(self):
+        if self.columns is None:
+            self.columns = uint32_columns(
+                self.memory[self.entries_start:self.rows_start], self.num_structs, PARAM_ENTRY_SIZE//4)
+        return self.columns
+
+    @property
+    def ids(self):
+        return self.header_columns()[0]
+
+    @property
+    def st_offsets(self):
+        return self.header_columns()[1]
+
+    @property
+    def old_name_offsets(self):
+        return self.header_columns()[2]
+
+    def __len__(self):
+        return self.num_structs
+
+    def __iter__(self):
+        for i in range(self.num_structs):
+            yield self.header(i), self.row(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(self.header(i), self.row(i)) for i in range(*index.indices(self.num_structs))]
+        if index < 0:
+            index += self.num_structs
+        if not 0 <= index < self.num_structs:
+            raise IndexError('row {} out of range'.format(index))
+        return self.header(index), self.row(index)
+
+    def header(self, index):
+        return tuple(column[index] for column in self.header_columns())
+
+    def build_id_index(self):
+        """
+        Map param IDs to rows, and keep the IDs sorted alongside their rows for range queries.
+        Where an ID repeats, the first row with it wins.
+        """
+        ids = self.ids
+        self.id_rows = dict(zip(reversed(ids), range(len(ids)-1, -1, -1)))
+        self.sorted_rows = array(UINT32, sorted(range(len(ids)), key=ids.__getitem__))
+        self.sorted_ids = array(UINT32, (ids[row] for row in self.sorted_rows))
+
+    def row_for_id(self, param_id):
+        """
+        Row index holding param_id, or None
+        """
+        if self.id_rows is None:
+            self.build_id_index()
+        return self.id_rows.get(param_id)
+
+    def get(self, param_id, default=None):
+        """
+        (ID header, row) item for param_id
+        """
+        index = self.row_for_id(param_id)
+        if index is None:
+            return default
+        return self.header(index), self.row(index)
+
+    def rows_for_ids(self, ids):
+        """
+        Row index holding each of an array of IDs, or -1 where there's none, in one
+        binary search over the sorted IDs. Needs NumPy.
+        """
+        if self.sorted_ids is None:
+            self.build_id_index()
+        sorted_ids = np.frombuffer(self.sorted_ids, dtype=np.uint32).astype(np.int64)
+        sorted_rows = np.frombuffer(self.sorted_rows, dtype=np.uint32).astype(np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(sorted_ids):
+            return np.full(ids.shape, -1, dtype=np.int64)
+        # Sorting was stable, so the leftmost match is the first row with the ID
+        found = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[found] == ids, sorted_rows[found], -1)
+
+    def rows_in_id_range(self, low, high):
+        """
+        Row indexes whose IDs lie in [low, high], in ID order
+        """
+        if self.sorted_ids is None:
+            self.build_id_index()
+        start = bisect.bisect_left(self.sorted_ids, low)
+        end = bisect.bisect_right(self.sorted_ids, high)
+        return self.sorted_rows[start:end]
+
+    def row(self, index):
+        offset = self.rows_start + self.stride*index
+        memory = self.memory
+        if memory.readonly:
+            return self.struct_type.from_buffer_copy(memory, offset)
+        return self.struct_type.from_buffer(memory, offset)
+
+    def column(self, field):
+        """
+        Every row's value of one field, with bitfields unpacked.
+        A contiguous NumPy array where NumPy is available, otherwise an array.array,
+        or a list of tuples for array fields.
+        """
+        if field not in self.field_columns:
+            values = self.read_column(field)
+            self.field_columns[field] = np.ascontiguousarray(values) if np is not None else values
+        return self.field_columns[field]
+
+    def read_column(self, field):
+        """
+        Values of one field as column() gives them, without keeping them if the column isn't built.
+        With NumPy this may be a strided view of the rows rather than a copy.
+        """
+        if field in self.field_columns:
+            return self.field_columns[field]
+        if hidden_field(field):
+            raise KeyError('{} is padding or reserved space'.format(field))
+        if np is not None:
+            return field_values(param_array(self.memory, self.struct_type), self.struct_type, field)
+        return self.unpack_column(field)
+
+    def unpack_column(self, field):
+        """
+        Column of one field without NumPy, unpacking every row with a single struct format
+        """
+        ctype = dict((name, ctype) for name, ctype, *bits in self.struct_type._fields_)[field]
+        offset = getattr(self.struct_type, field).offset
+        size = ctypes.sizeof(ctype)
+        count = 1
+        if issubclass(ctype, ctypes.Array):
+            count = ctype._length_
+            ctype = ctype._type_
+        code = ctype._type_
+        unpacker = struct.Struct('<{}x{}{}{}x'.format(offset, count, code, self.stride - offset - size))
+        rows = self.memory[self.rows_start:self.end]
+        if count > 1:
+            return list(unpacker.iter_unpack(rows))
+        values = (value for value, in unpacker.iter_unpack(rows))
+        layout = bitfield_layouts(self.struct_type).get(field)
+        if layout:
+            mask = (1 << layout.width) - 1
+            values = ((value >> layout.bit_offset) & mask for value in values)
+        return array(ARRAY_TYPECODES[code], values)
+
+    def invalidate(self, field=None):
+        """
+        Drop built columns after rows have been written, one field or all of them
+        """
+        if field is None:
+            self.field_columns.clear()
+        else:
+            self.field_columns.pop(field, None)
+
+    def release(self):
+        """
+        Drop the rows read from a DumpRange and the columns built from them,
+        to be read in again when next used. Rows already handed out keep their own copy.
+        """
+        if self.range is not None:
+            self.source = self.range
+            self.range.release()
+            self.invalidate()
+
+
+def make_struct(memory, struct_type):
+    """
+    Try same as weapon param structs
+    (u?)int16 holds number of entries
+    After that, "EQUIP_PARAM_WEAPON_ST" in UTF-8
+    14 bytes after null terminator, ID of first entry (uint32) followed by offset to struct (uint32) and 4 unk bytes (old name id?)
+    repeat 12 byte struct for all entries
+    """
+    table = ParamTable(memory, struct_type)
+    return table, table.end
+
+
+# UTF-16 code units up to the first null one, which works on mapped and streamed memory alike without a copy
+UTF16_STRING_RE = re.compile(b'(?:[^\x00].|\x00[^\x00])*', re.DOTALL)
+
+
+def find_terminator(blob, start):
+    """
+    Offset of the UTF-16 null terminating the string at start, or the end of blob if there isn't one
+    """
+    return UTF16_STRING_RE.match(blob, start).end()
+
+
+class StringList:
+    """
+    Lazy view of one FMG string list in a dump.
+    IDs and string offsets are parsed on first use; strings are decoded, without
+    any length cap, the first time they're accessed.
+    Items are (ID, offset, string) triples.
+    memory may also be a DumpRange, in which case nothing is read until the list is used,
+    and release() lets go of what was read.
+    """
+    def __init__(self, memory):
+        self.source = memory
+        self.range = memory if isinstance(memory, DumpRange) else None
+        if isinstance(memory, DumpRange):
+            self.size = len(memory)
+        else:
+            self.size = int.from_bytes(memory[4:8], 'little')
+            self.source = memory[:self.size]
+        self.columns = None
+        self.strings = {}
+
+    @property
+    def memory(self):
+        source = self.source
+        if isinstance(source, DumpRange):
+            source = self.source = source.load()
+        return source
+
+    @property
+    def loaded(self):
+        return not isinstance(self.source, DumpRange)
+
+    def header_columns(self):
+        if self.columns is None:
+            memory = self.memory
+            num_blocks = int.from_bytes(memory[12:16], 'little')
+            start = FMG_HEADER_SIZE
+            off_start = start + FMG_BLOCK_SIZE*num_blocks
+            st_offsets, st_IDs, end_IDs = uint32_columns(memory[start:off_start], num_blocks, FMG_BLOCK_SIZE//4)
+            ids = array(UINT32, itertools.chain.from_iterable(map(range, st_IDs, [end_ID+1 for end_ID in end_IDs])))
+            self.columns = ids, uint32_columns(memory[off_start:], len(ids), 1)[0]
+        return self.columns
+
+    @property
+    def ids(self):
+        return self.header_columns()[0]
+
+    @property
+    def offsets(self):
+        return self.header_columns()[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self.ids[i], self.offsets[i], self.string(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.ids)))]
+        return self.ids[index], self.offsets[index], self.string(index)
+
+    def string(self, index):
+        if index < 0:
+            index += len(self.ids)
+        if index not in self.strings:
+            self.strings[index] = self.read_string(index)
+        return self.strings[index]
+
+    def read_string(self, index):
+        """
+        String as string() gives it, without keeping it if it hasn't been decoded yet
+        """
+        if index < 0:
+            index += len(self.ids)
+        if index in self.strings:
+            return self.strings[index]
+        offset = self.offsets[index]
+        if offset == 0:
+            # No string for this ID
+            return ''
+        memory = self.memory
+        return str(memory[offset:find_terminator(memory, offset)], 'utf_16_le')
+
+    def release(self):
+        """
+        Drop the strings read from a DumpRange, to be read in again when next used
+        """
+        if self.range is not None:
+            self.source = self.range
+            self.range.release()
+            self.strings = {}
+
+
+def make_strings(memory):
+    """
+    memory starts at the FMG header, whose bytes 4-8 hold the size of the whole list
+    """
+    strings = StringList(memory)
+    return strings, strings.size
@@ -0,0 +1,164 @@
+'''
+Weapon attack ratings for every weapon, upgrade level and stat spread at once
+
+@package DarkSoulsParameterEditor
+'''
+
+import itertools
+
+from layouts import np, require_numpy
+from references import WEAPON
+
+REINFORCE = 'REINFORCE_PARAM_WEAPON_ST'
+CORRECT_GRAPH = 'CACL_CORRECT_GRAPH_ST'
+
+"""
+For each damage type, a weapon's attack rating at reinforcement level L is
+
+    base = attackBase<Type> * <type>AtkRate
+    AR   = base * (1 + sum over its scaling stats of correct<Stat>/100 * correct<Stat>Rate * curve(stat))
+
+where the reinforce row is reinforceTypeId + L and curve is the weapon's
+correctType row of CACL_CORRECT_GRAPH_ST as a fraction of its stageMaxGrowVal
+range. Physical damage scales with strength and dexterity, magic with
+intelligence and faith, and fire and lightning don't scale.
+Stats are in the order (strength, dexterity, intelligence, faith).
+"""
+STATS = ['Strength', 'Agility', 'Magic', 'Faith']
+DAMAGE_TYPES = {
+    'physics': ('attackBasePhysics', 'physicsAtkRate', ['Strength', 'Agility']),
+    'magic': ('attackBaseMagic', 'magicAtkRate', ['Magic', 'Faith']),
+    'fire': ('attackBaseFire', 'fireAtkRate', []),
+    'thunder': ('attackBaseThunder', 'thunderAtkRate', []),
+    }
+MAX_LEVEL = 15
+MAX_STAT = 99
+CURVE_STAGES = 5
+DEFAULT_STAT_STEPS = (10, 20, 30, 40, 50, 99)
+
+
+def stat_grid(strength=DEFAULT_STAT_STEPS, agility=DEFAULT_STAT_STEPS, magic=(10,), faith=(10,)):
+    """
+    Every combination of the given stat values, as an (n, 4) array of stat spreads
+    """
+    require_numpy()
+    return np.array(list(itertools.product(strength, agility, magic, faith)), dtype=np.int64).reshape(-1, len(STATS))
+
+
+def graph_curves(graphs):
+    """
+    (graph rows, MAX_STAT + 1) array of each CACL_CORRECT_GRAPH_ST row's growth
+    fraction at every stat value, every stage of every row worked out together
+    """
+    stage_stats = np.stack([graphs.column('stageMaxVal{}'.format(i)) for i in range(CURVE_STAGES)], 1).astype(np.float64)
+    stage_grow = np.stack([graphs.column('stageMaxGrowVal{}'.format(i)) for i in range(CURVE_STAGES)], 1).astype(np.float64)
+    exponents = np.stack([graphs.column('adjPt_maxGrowVal{}'.format(i)) for i in range(CURVE_STAGES)], 1).astype(np.float64)
+    stats = np.arange(MAX_STAT + 1, dtype=np.float64)[None, :]
+    curves = np.where(stats <= stage_stats[:, :1], stage_grow[:, :1], stage_grow[:, -1:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for stage in range(CURVE_STAGES - 1):
+            low, high = stage_stats[:, stage:stage+1], stage_stats[:, stage+1:stage+2]
+            grow_low, grow_high = stage_grow[:, stage:stage+1], stage_grow[:, stage+1:stage+2]
+            exponent = exponents[:, stage:stage+1]
+            ratio = np.clip((stats - low) / (high - low), 0, 1)
+            # Positive exponents bend the stage one way and negative ones the other
+            shaped = np.where(exponent > 0, ratio ** exponent, 1 - (1 - ratio) ** -exponent)
+            in_stage = (stats > low) & (stats <= high)
+            curves = np.where(in_stage, grow_low + (grow_high - grow_low) * shaped, curves)
+    return curves / 100
+
+
+class AttackRatings:
+    """
+    Attack ratings over the cube of weapon rows x levels x stat spreads.
+    by_type maps damage types to (weapons, MAX_LEVEL + 1, spreads) float32 arrays,
+    NaN where a weapon has no reinforce row for a level or no correction graph.
+    """
+    def __init__(self, weapon_ids, stats, by_type):
+        self.weapon_ids = weapon_ids
+        self.levels = np.arange(MAX_LEVEL + 1)
+        self.stats = stats
+        self.by_type = by_type
+
+    @property
+    def total(self):
+        return sum(self.by_type.values())
+
+    def rating(self, weapon_id, level, stats):
+        """
+        {damage type: AR} for one weapon ID, level and (strength, dexterity, intelligence, faith) spread,
+        raising KeyError for a weapon, level or spread that wasn't computed
+        """
+        weapons = np.flatnonzero(self.weapon_ids == weapon_id)
+        if not len(weapons):
+            raise KeyError('No weapon with ID {}'.format(weapon_id))
+        if not 0 <= level < len(self.levels):
+            raise KeyError('Level {} is not between 0 and {}'.format(level, len(self.levels) - 1))
+        spreads = np.flatnonzero((self.stats == np.asarray(stats)).all(1))
+        if not len(spreads):
+            raise KeyError('Stat spread {} is not in the grid'.format(tuple(stats)))
+        weapon, spread = int(weapons[0]), int(spreads[0])
+        return {kind: float(values[weapon, level, spread]) for kind, values in self.by_type.items()}
+
+
+class AttackRatingCalculator:
+    """
+    Computes AttackRatings from the weapon, reinforce and correction graph tables
+    of a dump, keeping results per stat grid until invalidate() is called.
+    param_lists maps struct names to lists of ParamTables, as the editor holds them;
+    the first table of each struct is used.
+    """
+    def __init__(self, param_lists):
+        require_numpy()
+        self.param_lists = param_lists
+        self.cache = {}
+
+    def invalidate(self):
+        """
+        Forget results after a weapon, reinforce or graph row has changed
+        """
+        self.cache.clear()
+        for name in (WEAPON, REINFORCE, CORRECT_GRAPH):
+            for table in self.param_lists.get(name, []):
+                table.invalidate()
+
+    def ratings(self, stats=None):
+        """
+        AttackRatings for an (n, 4) array of stat spreads, by default stat_grid()
+        """
+        stats = stat_grid() if stats is None else np.asarray(stats, dtype=np.int64).reshape(-1, len(STATS))
+        key = stats.tobytes()
+        if key not in self.cache:
+            self.cache[key] = self.compute(stats)
+        return self.cache[key]
+
+    def compute(self, stats):
+        weapons = self.param_lists[WEAPON][0]
+        reinforce = self.param_lists[REINFORCE][0]
+        graphs = self.param_lists[CORRECT_GRAPH][0]
+        stats = np.clip(stats, 0, MAX_STAT)
+
+        # (weapons, levels) rows of the reinforce table, and (weapons,) rows of the graph table
+        reinforce_ids = weapons.column('reinforceTypeId').astype(np.int64)[:, None] + np.arange(MAX_LEVEL + 1)
+        reinforce_rows = reinforce.rows_for_ids(reinforce_ids)
+        graph_rows = graphs.rows_for_ids(weapons.column('correctType'))
+        missing = (reinforce_rows < 0) | (graph_rows < 0)[:, None]
+
+        def reinforce_column(field):
+            values = reinforce.column(field).astype(np.float32)[np.maximum(reinforce_rows, 0)]
+            return np.where(missing, np.nan, values)
+
+        # (weapons, spreads) growth fraction for each stat
+        curves = graph_curves(graphs).astype(np.float32)[np.maximum(graph_rows, 0)]
+        growth = {stat: curves[:, stats[:, i]] for i, stat in enumerate(STATS)}
+
+        by_type = {}
+        for kind, (base_field, rate_field, scaling) in DAMAGE_TYPES.items():
+            base = weapons.column(base_field).astype(np.float32)[:, None] * reinforce_column(rate_field)
+            bonus = np.zeros(base.shape + (len(stats),), dtype=np.float32)
+            for stat in scaling:
+                correct = weapons.column('correct' + stat).astype(np.float32)[:, None] / 100
+                coefficient = correct * reinforce_column('correct{}Rate'.format(stat))
+                bonus += coefficient[:, :, None] * growth[stat][:, None, :]
+            by_type[kind] = base[:, :, None] * (1 + bonus)
+        return AttackRatings(np.asarray(weapons.ids), stats, by_type)
@@ -0,0 +1,242 @@
+'''
+Cross-table references between param tables
+
+@package DarkSoulsParameterEditor
+'''
+
+from layouts import np
+
+
+SP_EFFECT = 'SP_EFFECT_PARAM_ST'
+ITEMLOT = 'ITEMLOT_PARAM_ST'
+WEAPON = 'EQUIP_PARAM_WEAPON_ST'
+PROTECTOR = 'EQUIP_PARAM_PROTECTOR_ST'
+ACCESSORY = 'EQUIP_PARAM_ACCESSORY_ST'
+GOODS = 'EQUIP_PARAM_GOODS_ST'
+MAGIC = 'MAGIC_PARAM_ST'
+ATK = 'ATK_PARAM_ST'
+BULLET = 'BULLET_PARAM_ST'
+MTRL_SET = 'EQUIP_MTRL_SET_PARAM_ST'
+NPC = 'NPC_PARAM_ST'
+NPC_THINK = 'NPC_THINK_PARAM_ST'
+BEHAVIOR = 'BEHAVIOR_PARAM_ST'
+
+"""
+Some fields point into a table chosen by another field of the same row.
+"""
+ITEM_CATEGORIES = {0x00000000: WEAPON, 0x10000000: PROTECTOR, 0x20000000: ACCESSORY, 0x40000000: GOODS}
+SHOP_EQUIP_TYPES = {0: WEAPON, 1: PROTECTOR, 2: ACCESSORY, 3: GOODS, 4: MAGIC}
+REF_CATEGORIES = {0: ATK, 1: BULLET, 2: SP_EFFECT}
+
+
+def fields(template, *suffixes):
+    return [template.format(suffix) for suffix in suffixes]
+
+
+def lot_fields(*fields):
+    return {field: ITEMLOT for field in fields}
+
+
+VAGRANT_LOTS = lot_fields('vagrantItemLotId', 'vagrantBonusEneDropItemLotId', 'vagrantItemEneDropItemLotId')
+
+"""
+Foreign keys by param struct name: {field: target}, where the target is either a
+struct name or a (discriminator field, {discriminator value: struct name}) pair.
+REINFORCE_PARAM_*_ST's spEffectId, residentSpEffectId and materialSetId fields
+aren't here: they're offsets added to the weapon's or protector's own IDs.
+"""
+FOREIGN_KEYS = {
+    WEAPON: dict(
+        {field: SP_EFFECT for field in fields('spEffectBehaviorId{}', 0, 1, 2)
+            + ['residentSpEffectId', 'residentSpEffectId1', 'residentSpEffectId2']},
+        materialSetId=MTRL_SET,
+        reinforceTypeId='REINFORCE_PARAM_WEAPON_ST',
+        **{field: WEAPON for field in ['originEquipWep'] + fields('originEquipWep{}', *range(1, 16))},
+        **VAGRANT_LOTS),
+    PROTECTOR: dict(
+        {field: SP_EFFECT for field in ['residentSpEffectId', 'residentSpEffectId2', 'residentSpEffectId3']},
+        materialSetId=MTRL_SET,
+        reinforceTypeId='REINFORCE_PARAM_PROTECTOR_ST',
+        knockbackParamId='KNOCKBACK_PARAM_ST',
+        **VAGRANT_LOTS),
+    ACCESSORY: dict(refId=('refCategory', REF_CATEGORIES), **VAGRANT_LOTS),
+    GOODS: dict(refId=('refCategory', REF_CATEGORIES), **VAGRANT_LOTS),
+    MAGIC: dict(refId=('refCategory', REF_CATEGORIES), limitCancelSpEffectId=SP_EFFECT),
+    MTRL_SET: {field: GOODS for field in fields('materialId0{}', 1, 2, 3, 4, 5)},
+    'SHOP_LINEUP_PARAM': dict(equipId=('equipType', SHOP_EQUIP_TYPES), mtrlId=MTRL_SET),
+    ITEMLOT: {'lotItemId0{}'.format(i): ('lotItemCategory0{}'.format(i), ITEM_CATEGORIES) for i in range(1, 9)},
+    NPC: dict(
+        {field: SP_EFFECT for field in fields('spEffectID{}', *range(8)) + ['GameClearSpEffectID']},
+        knockbackParamId='KNOCKBACK_PARAM_ST',
+        aiThinkId=NPC_THINK,
+        humanityLotId=ITEMLOT,
+        **lot_fields(*fields('itemLotId_{}', *range(1, 7)))),
+    BEHAVIOR: dict(refId=('refType', REF_CATEGORIES)),
+    ATK: {field: SP_EFFECT for field in fields('spEffectId{}', *range(5))},
+    BULLET: dict(
+        {field: SP_EFFECT for field in fields('spEffectId{}', *range(5)) + ['spEffectIDForShooter']},
+        atkId_Bullet=ATK,
+        HitBulletID=BULLET,
+        autoSearchNPCThinkID=NPC_THINK),
+    SP_EFFECT: {field: SP_EFFECT for field in ['replaceSpEffectId', 'cycleOccurrenceSpEffectId', 'atkOccurrenceSpEffectId']},
+    'HIT_MTRL_PARAM_ST': {field: SP_EFFECT for field in fields('spEffectIdOnHit{}', 0, 1)},
+    }
+
+
+def field_column(table, field):
+    """
+    Values of one field for every row of a ParamTable, as Python numbers
+    """
+    column = table.column(field)
+    if np is not None:
+        return column.tolist()
+    return column
+
+
+def iter_references(name, table, foreign_keys=FOREIGN_KEYS):
+    """
+    (row, field, target struct name, target ID) for every foreign key value in a table
+    """
+    for field, target in foreign_keys.get(name, {}).items():
+        values = field_column(table, field)
+        if isinstance(target, tuple):
+            discriminator, targets = target
+            for row, (value, kind) in enumerate(zip(values, field_column(table, discriminator))):
+                if kind in targets:
+                    yield row, field, targets[kind], value
+        else:
+            for row, value in enumerate(values):
+                yield row, field, target, value
+
+
+def resolve_ids(param_lists, name, ids):
+    """
+    (table numbers, row indexes) of each of a sequence of IDs in the named tables, -1 where
+    an ID isn't found. Where several tables hold an ID the first one is given, so callers
+    joining on structs with more than one table should show the table number.
+    Arrays with NumPy, using each table's sorted IDs; lists of row_for_id() lookups without.
+    """
+    tables = param_lists.get(name, [])
+    if np is None:
+        found = []
+        for param_id in ids:
+            for table_no, table in enumerate(tables):
+                row = table.row_for_id(param_id)
+                if row is not None:
+                    found.append((table_no, row))
+                    break
+            else:
+                found.append((-1, -1))
+        return [table_no for table_no, row in found], [row for table_no, row in found]
+    ids = np.asarray(ids, dtype=np.int64)
+    table_nos = np.full(ids.shape, -1, dtype=np.int64)
+    rows = np.full(ids.shape, -1, dtype=np.int64)
+    for table_no, table in enumerate(tables):
+        missing = rows < 0
+        if not missing.any():
+            break
+        table_rows = table.rows_for_ids(ids[missing])
+        table_nos[np.flatnonzero(missing)[table_rows >= 0]] = table_no
+        rows[missing] = table_rows
+    return table_nos, rows
+
+
+def iter_row_references(name, row, foreign_keys=FOREIGN_KEYS):
+    """
+    (field, target struct name, target ID) for every foreign key value in one row struct
+    """
+    for field, target in foreign_keys.get(name, {}).items():
+        if isinstance(target, tuple):
+            discriminator, targets = target
+            kind = getattr(row, discriminator)
+            if kind not in targets:
+                continue
+            target = targets[kind]
+        yield field, target, getattr(row, field)
+
+
+class ReferenceIndex:
+    """
+    Forward and reverse foreign key references across all loaded param tables.
+    param_lists maps struct names to lists of ParamTables, as the editor holds them.
+    A row is identified by (struct name, table number, row index).
+    Only IDs that resolve to a row in a loaded table are indexed, which also drops -1/0 placeholders.
+    Some structs have more than one table, such as the NPC and PC ATK_PARAM_ST and
+    BEHAVIOR_PARAM_ST, and the dump doesn't say which is which. target_tables pins
+    references from one table to one table of the target struct, as
+    {(source struct name, source table number, target struct name): target table number};
+    otherwise a reference resolves to the row with its ID in every table of the target struct,
+    and references resolving to more than one row are listed in self.ambiguous.
+    """
+    def __init__(self, param_lists, foreign_keys=FOREIGN_KEYS, target_tables=None):
+        self.param_lists = param_lists
+        self.foreign_keys = foreign_keys
+        self.target_tables = target_tables or {}
+        self.forward = {}
+        self.reverse = {}
+        # {(source row, field): [target rows]} for IDs found in more than one table
+        self.ambiguous = {}
+        for name, tables in param_lists.items():
+            for table_no, table in enumerate(tables):
+                for row, field, target, value in iter_references(name, table, foreign_keys):
+                    self.add((name, table_no, row), field, target, value)
+
+    def add(self, source_row, field, target, value):
+        target_rows = self.resolve_all(target, value, self.target_tables.get((source_row[0], source_row[1], target)))
+        if len(target_rows) > 1:
+            self.ambiguous[source_row, field] = target_rows
+        for target_row in target_rows:
+            self.forward.setdefault(source_row, []).append((field, target_row))
+            self.reverse.setdefault(target_row, []).append((source_row, field))
+
+    def row_changed(self, name, table_no, row):
+        """
+        Re-read the foreign keys of one edited row, dropping the table's stale columns
+        """
+        source_row = (name, table_no, row)
+        for field, target_row in self.forward.pop(source_row, []):
+            self.ambiguous.pop((source_row, field), None)
+            self.reverse[target_row].remove((source_row, field))
+            if not self.reverse[target_row]:
+                del self.reverse[target_row]
+        table = self.param_lists[name][table_no]
+        table.invalidate()
+        struct = table.row(row)
+        for field, target, value in iter_row_references(name, struct, self.foreign_keys):
+            self.add(source_row, field, target, value)
+
+    def resolve_all(self, name, param_id, table_no=None):
+        """
+        [(struct name, table number, row index)] of param_id in every named table, or only in table_no if given
+        """
+        tables = self.param_lists.get(name, [])
+        table_nos = range(len(tables)) if table_no is None else [table_no] if table_no < len(tables) else []
+        found = []
+        for n in table_nos:
+            row = tables[n].row_for_id(param_id)
+            if row is not None:
+                found.append((name, n, row))
+        return found
+
+    def resolve(self, name, param_id, table_no=None):
+        """
+        (struct name, table number, row index) of param_id in the named tables, or None.
+        Raises ValueError if more than one table holds it and table_no doesn't say which.
+        """
+        found = self.resolve_all(name, param_id, table_no)
+        if len(found) > 1:
+            raise ValueError('ID {} is in {} tables {}'.format(param_id, name, [row[1] for row in found]))
+        return found[0] if found else None
+
+    def references(self, name, table_no, row):
+        """
+        [(field, target row)] referenced by a row
+        """
+        return self.forward.get((name, table_no, row), [])
+
+    def referrers(self, name, param_id, table_no=None):
+        """
+        [(source row, field)] referencing the rows with param_id in the named tables, or only in table_no if given
+        """
+        return [referrer for target_row in self.resolve_all(name, param_id, table_no)
+                for referrer in self.reverse.get(target_row, [])]
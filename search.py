@@ -0,0 +1,335 @@
+'''
+Full-text and numeric search across every string list and param table
+
+@package DarkSoulsParameterEditor
+'''
+
+import sys
+import os
+import bisect
+import collections
+import ctypes
+import json
+import math
+from array import array
+
+from dump import dump_fingerprint, keys_fingerprint, never
+from params import UINT32, hidden_field
+from layouts import np
+
+
+TextHit = collections.namedtuple('TextHit', ['list_name', 'row', 'ID', 'string'])
+ValueHit = collections.namedtuple('ValueHit', ['struct_name', 'table_no', 'field', 'row', 'value'])
+
+TRIGRAM_SIZE = 3
+# Column name for the param ID header, which is searched along with the fields
+ID_FIELD = 'ID'
+
+
+def trigrams(text):
+    return {text[i:i+TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+
+def value_fields(struct_type):
+    """
+    Scalar fields of a struct worth searching by value, leaving out arrays, padding and reserved space
+    """
+    return [name for name, ctype, *bits in struct_type._fields_
+            if issubclass(ctype, ctypes._SimpleCData) and not hidden_field(name)]
+
+
+class TemporaryReads:
+    """
+    Releases lists and tables that were only read in to be indexed once indexing moves past them,
+    so streamed dumps are never held in memory all at once. Ones already in use are left loaded.
+    Indexing reads with read_string() and read_column(), so nothing decoded is kept either way.
+    """
+    def __init__(self):
+        self.source = None
+        self.release = False
+
+    def use(self, source):
+        if source is not self.source:
+            self.done()
+            self.source = source
+            self.release = not source.loaded
+        return source
+
+    def done(self):
+        if self.release:
+            self.source.release()
+        self.source = None
+        self.release = False
+
+
+class TextIndex:
+    """
+    Trigram index over the casefolded text of every string in a set of string lists.
+    Entry n is row rows[n] of the list named list_names[lists[n]], and each trigram
+    maps to the ascending entry numbers of the strings containing it.
+    Queries shorter than a trigram fall back to checking every string.
+    """
+    def __init__(self, list_names, lists, rows, postings):
+        self.list_names = list_names
+        self.lists = lists
+        self.rows = rows
+        self.postings = postings
+
+    @classmethod
+    def build(cls, string_lists, interrupted=never):
+        """
+        Index over the string lists, or None if interrupted() became true first
+        """
+        list_names = sorted(string_lists)
+        lists = array(UINT32)
+        rows = array(UINT32)
+        postings = collections.defaultdict(lambda: array(UINT32))
+        reads = TemporaryReads()
+        try:
+            for list_no, name in enumerate(list_names):
+                if interrupted():
+                    return None
+                strings = reads.use(string_lists[name])
+                for row in range(len(strings)):
+                    entry = len(rows)
+                    lists.append(list_no)
+                    rows.append(row)
+                    for trigram in trigrams(strings.read_string(row).casefold()):
+                        postings[trigram].append(entry)
+        finally:
+            reads.done()
+        return cls(list_names, lists, rows, dict(postings))
+
+    def candidates(self, text):
+        if len(text) < TRIGRAM_SIZE:
+            return range(len(self.rows))
+        found = sorted((self.postings.get(trigram, ()) for trigram in trigrams(text)), key=len)
+        if not found[0]:
+            return []
+        return sorted(set(found[0]).intersection(*found[1:]))
+
+    def search(self, string_lists, text, limit=None):
+        """
+        TextHits for strings containing text, ignoring case
+        """
+        text = text.casefold()
+        hits = []
+        for entry in self.candidates(text):
+            strings = string_lists[self.list_names[self.lists[entry]]]
+            row = self.rows[entry]
+            string = strings.read_string(row)
+            if text in string.casefold():
+                hits.append(TextHit(self.list_names[self.lists[entry]], row, strings.ids[row], string))
+                if len(hits) == limit:
+                    break
+        return hits
+
+
+class ValueIndex:
+    """
+    Every value of every scalar field of every param table, sorted, for equality and range queries.
+    Value n is from row rows[n] of columns[column_nos[n]], a (struct name, table number, field) triple,
+    where the field may also be ID_FIELD for the param IDs.
+    Values are held as doubles, which is exact for every integer field type in the structs.
+    NaNs are left out.
+    """
+    def __init__(self, columns, values, column_nos, rows):
+        self.columns = columns
+        self.values = values
+        self.column_nos = column_nos
+        self.rows = rows
+
+    @classmethod
+    def build(cls, param_lists, interrupted=never):
+        """
+        Index over the param tables, or None if interrupted() became true first
+        """
+        columns = [(name, table_no, field)
+                   for name in sorted(param_lists)
+                   for table_no, table in enumerate(param_lists[name])
+                   for field in [ID_FIELD] + value_fields(table.struct_type)]
+        if np is not None:
+            return cls.build_numpy(param_lists, columns, interrupted)
+        triples = []
+        reads = TemporaryReads()
+        try:
+            for column_no, (name, table_no, field) in enumerate(columns):
+                if interrupted():
+                    return None
+                table = reads.use(param_lists[name][table_no])
+                column = table.ids if field == ID_FIELD else table.read_column(field)
+                for row, value in enumerate(column):
+                    if value == value:
+                        triples.append((value, column_no, row))
+        finally:
+            reads.done()
+        triples.sort()
+        return cls(columns, array('d', (t[0] for t in triples)),
+                   array(UINT32, (t[1] for t in triples)), array(UINT32, (t[2] for t in triples)))
+
+    @classmethod
+    def build_numpy(cls, param_lists, columns, interrupted=never):
+        values, column_nos, rows = [], [], []
+        reads = TemporaryReads()
+        try:
+            for column_no, (name, table_no, field) in enumerate(columns):
+                if interrupted():
+                    return None
+                table = reads.use(param_lists[name][table_no])
+                if field == ID_FIELD:
+                    column = np.frombuffer(table.ids, dtype=np.uint32).astype(np.float64)
+                else:
+                    with np.errstate(invalid='ignore'):  # Signalling NaNs in float fields
+                        column = table.read_column(field).astype(np.float64)
+                present = ~np.isnan(column)
+                values.append(column[present])
+                column_nos.append(np.full(present.sum(), column_no, dtype=np.uint32))
+                rows.append(np.flatnonzero(present).astype(np.uint32))
+        finally:
+            reads.done()
+        if not values:
+            return cls(columns, array('d'), array(UINT32), array(UINT32))
+        values = np.concatenate(values)
+        order = np.argsort(values, kind='stable')
+        return cls(columns, array('d', values[order].tobytes()),
+                   array(UINT32, np.concatenate(column_nos)[order].tobytes()),
+                   array(UINT32, np.concatenate(rows)[order].tobytes()))
+
+    def search(self, low, high=None, limit=None):
+        """
+        ValueHits for values in [low, high], or equal to low if there's no high, in value order
+        """
+        if high is None:
+            high = low
+        start = bisect.bisect_left(self.values, low)
+        end = bisect.bisect_right(self.values, high)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [ValueHit(*self.columns[self.column_nos[n]], self.rows[n], self.values[n])
+                for n in range(start, end)]
+
+
+"""
+Search indexes are cached in a sidecar file next to the dump, under the same
+fingerprints as the scan index. The file is a JSON header line followed by
+the raw arrays it lists, in native byte order.
+"""
+SEARCH_INDEX_VERSION = 1
+SEARCH_INDEX_SUFFIX = '.searchidx'
+
+
+class SearchIndex:
+    """
+    Text and value indexes over everything loaded from a dump
+    """
+    def __init__(self, text, values):
+        self.text = text
+        self.values = values
+
+    @classmethod
+    def build(cls, string_lists, param_lists, interrupted=never):
+        """
+        Index over everything loaded, or None if interrupted() became true first
+        """
+        text = TextIndex.build(string_lists, interrupted)
+        values = ValueIndex.build(param_lists, interrupted) if text is not None else None
+        return cls(text, values) if values is not None else None
+
+    def search(self, string_lists, query, limit=None):
+        """
+        (TextHits, ValueHits) for a query. A finite number, or a range between
+        two in either order, is looked up in param values as well as being searched for as text.
+        """
+        text_hits = self.text.search(string_lists, query, limit) if query else []
+        try:
+            bounds = [float(bound) for bound in query.split('..')] if query else []
+        except ValueError:
+            bounds = []
+        if not 0 < len(bounds) <= 2 or not all(math.isfinite(bound) for bound in bounds):
+            bounds = []
+        value_hits = self.values.search(*sorted(bounds), limit=limit) if bounds else []
+        return text_hits, value_hits
+
+    def arrays(self):
+        text, values = self.text, self.values
+        trigram_keys = sorted(text.postings)
+        posting_ends = array(UINT32)
+        postings = array(UINT32)
+        for trigram in trigram_keys:
+            postings.extend(text.postings[trigram])
+            posting_ends.append(len(postings))
+        return trigram_keys, {
+            'lists': text.lists, 'rows': text.rows, 'posting_ends': posting_ends, 'postings': postings,
+            'values': values.values, 'column_nos': values.column_nos, 'value_rows': values.rows,
+            }
+
+    @classmethod
+    def from_arrays(cls, header, arrays):
+        postings, start = {}, 0
+        for trigram, end in zip(header['trigrams'], arrays['posting_ends']):
+            postings[trigram] = arrays['postings'][start:end]
+            start = end
+        text = TextIndex(header['list_names'], arrays['lists'], arrays['rows'], postings)
+        values = ValueIndex([tuple(column) for column in header['columns']],
+                            arrays['values'], arrays['column_nos'], arrays['value_rows'])
+        return cls(text, values)
+
+
+def load_search_index(dumpfile, string_keys, struct_types):
+    """
+    Cached SearchIndex for this dump, or None if there is no usable cache
+    """
+    try:
+        with open(dumpfile.filename + SEARCH_INDEX_SUFFIX, 'rb') as file:
+            header = json.loads(file.readline())
+            if (header['version'] != SEARCH_INDEX_VERSION
+                    or header['byteorder'] != sys.byteorder
+                    or header['keys'] != keys_fingerprint(string_keys, struct_types)
+                    or header['dump'] != dump_fingerprint(dumpfile)):
+                return None
+            arrays = {}
+            for name, typecode, length in header['arrays']:
+                arrays[name] = array(typecode)
+                arrays[name].fromfile(file, length)
+        return SearchIndex.from_arrays(header, arrays)
+    except (OSError, EOFError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_search_index(dumpfile, index, string_keys, struct_types):
+    trigram_keys, arrays = index.arrays()
+    header = {
+        'version': SEARCH_INDEX_VERSION,
+        'byteorder': sys.byteorder,
+        'keys': keys_fingerprint(string_keys, struct_types),
+        'dump': dump_fingerprint(dumpfile),
+        'list_names': index.text.list_names,
+        'columns': index.values.columns,
+        'trigrams': trigram_keys,
+        'arrays': [(name, values.typecode, len(values)) for name, values in arrays.items()],
+        }
+    path = dumpfile.filename + SEARCH_INDEX_SUFFIX
+    try:
+        with open(path + '.tmp', 'wb') as file:
+            file.write(json.dumps(header).encode('ascii') + b'\n')
+            for values in arrays.values():
+                values.tofile(file)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print("Couldn't write search index {}: {}".format(path, e))
+
+
+def search_index_cached(dumpfile, string_lists, param_lists, string_keys, struct_types, interrupted=never):
+    """
+    SearchIndex from the sidecar cache if it matches the dump, otherwise build and cache it.
+    Without a mapped dump there's nothing to key the cache on, so the index is just built.
+    None if interrupted() became true before the index was built.
+    """
+    if dumpfile is None:
+        return SearchIndex.build(string_lists, param_lists, interrupted)
+    index = load_search_index(dumpfile, string_keys, struct_types)
+    if index is None:
+        index = SearchIndex.build(string_lists, param_lists, interrupted)
+        if index is not None:
+            save_search_index(dumpfile, index, string_keys, struct_types)
+    return index
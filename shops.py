@@ -0,0 +1,77 @@
+'''
+Shop lineups joined to the items they sell
+
+@package DarkSoulsParameterEditor
+'''
+
+from layouts import np
+from references import field_column, resolve_ids, SHOP_EQUIP_TYPES, MTRL_SET
+
+SHOP = 'SHOP_LINEUP_PARAM'
+
+
+class ShopLineup:
+    """
+    Every SHOP_LINEUP_PARAM row resolved to the row it sells, by equipType and equipId,
+    to its item name and to its material set, all at once when the join is built.
+    columns holds the joined table, one sequence per header, ready to display or export;
+    unresolved items have an empty table name and row -1.
+    """
+    HEADERS = ['ID', 'Name', 'equipType', 'Table', 'equipId', 'Table No', 'Row',
+               'value', 'mtrlId', 'Material Row', 'sellQuantity', 'shopType', 'eventFlag', 'qwcId']
+
+    def __init__(self, shop, param_lists, names=None):
+        """
+        shop is the SHOP_LINEUP_PARAM ParamTable and names a NameIndex, if there are names
+        """
+        if np is not None:
+            equip_types = shop.column('equipType')
+            equip_ids = shop.column('equipId')
+            structs = np.full(len(shop), '', dtype=object)
+            table_nos = np.full(len(shop), -1, dtype=np.int64)
+            rows = np.full(len(shop), -1, dtype=np.int64)
+            item_names = np.full(len(shop), '', dtype=object)
+        else:
+            equip_types = field_column(shop, 'equipType')
+            equip_ids = field_column(shop, 'equipId')
+            structs, table_nos, rows, item_names = [''] * len(shop), [-1] * len(shop), [-1] * len(shop), [''] * len(shop)
+        for equip_type, name in SHOP_EQUIP_TYPES.items():
+            # Every shop row selling from one table is looked up in one go
+            if np is not None:
+                selected = np.flatnonzero(equip_types == equip_type)
+                selected_ids = equip_ids[selected]
+                structs[selected] = name
+                table_nos[selected], rows[selected] = resolve_ids(param_lists, name, selected_ids)
+            else:
+                selected = [row for row, row_type in enumerate(equip_types) if row_type == equip_type]
+                selected_ids = [equip_ids[row] for row in selected]
+                for row, table_no, found_row in zip(selected, *resolve_ids(param_lists, name, selected_ids)):
+                    structs[row], table_nos[row], rows[row] = name, table_no, found_row
+            item_names_for = names.names_for(name) if names is not None else None
+            if item_names_for:
+                for row, param_id in zip(selected, list(selected_ids)):
+                    item_names[row] = item_names_for.get(int(param_id), '')
+        if np is not None:
+            # Text columns as str arrays, which views.py compares as text
+            structs, item_names = structs.astype(str), item_names.astype(str)
+        material_rows = resolve_ids(param_lists, MTRL_SET, shop.column('mtrlId'))[1]
+        self.shop = shop
+        self.columns = dict(zip(self.HEADERS, [
+            shop.ids, item_names, equip_types, structs, equip_ids, table_nos, rows,
+            shop.column('value'), shop.column('mtrlId'), material_rows,
+            shop.column('sellQuantity'), shop.column('shopType'), shop.column('eventFlag'), shop.column('qwcId')]))
+        if np is not None:
+            self.columns = {header: np.asarray(values) for header, values in self.columns.items()}
+
+    def __len__(self):
+        return len(self.shop)
+
+    def column(self, header):
+        return self.columns[header]
+
+    def row(self, row):
+        """
+        {header: value} for one joined row
+        """
+        return {header: values[row].item() if np is not None else values[row]
+                for header, values in self.columns.items()}
@@ -0,0 +1,141 @@
+'''
+Row order and row filters for table views, worked out a whole column at a time
+
+@package DarkSoulsParameterEditor
+'''
+
+import re
+import operator
+
+from layouts import np
+
+
+"""
+Filters are conditions joined by 'and' or '&', each comparing a column to a value:
+    ID >= 1000 and sortId < 50
+    Name ~ dagger
+    Name ~ "sword and shield"
+~ tests for a substring, ignoring case. Numbers may be given in hex as 0x...
+Values in single or double quotes may hold 'and', '&' or surrounding spaces.
+"""
+CONDITION_RE = re.compile(r'^\s*(\w[\w. ]*?)\s*(==|!=|<=|>=|<|>|=|~)\s*(.*?)\s*$')
+# Quoted values straight after an operator are matched so that conjunctions inside them can be skipped
+CONJUNCTION_RE = re.compile(r'(?<=[=<>~])\s*("[^"]*"|\'[^\']*\')|\s+and\s+|&', re.IGNORECASE)
+OPERATORS = {
+    '==': operator.eq, '=': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    }
+
+
+def parse_number(text):
+    try:
+        return int(text, 0)
+    except ValueError:
+        return float(text)
+
+
+def is_text(values):
+    if np is not None:
+        return values.dtype.kind == 'U'
+    return isinstance(values, list) and bool(values) and isinstance(values[0], str)
+
+
+def split_conditions(text):
+    """
+    Conditions of a filter, split at every 'and' or '&' outside quotes
+    """
+    parts, start = [], 0
+    for match in CONJUNCTION_RE.finditer(text):
+        if not match.group(1):
+            parts.append(text[start:match.start()])
+            start = match.end()
+    return parts + [text[start:]]
+
+
+def parse_filter(text):
+    """
+    [(column name, operator, value text)] for a filter, raising ValueError if it can't be read
+    """
+    conditions = []
+    for part in split_conditions(text.strip()) if text.strip() else []:
+        match = CONDITION_RE.match(part)
+        if not match or not match.group(3):
+            raise ValueError('Expected "column op value", got {!r}'.format(part.strip()))
+        name, op, value = match.groups()
+        if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+            value = value[1:-1]
+        conditions.append((name, op, value))
+    return conditions
+
+
+def condition_matches(values, name, op, value):
+    if is_text(values):
+        if op == '~':
+            return [value.casefold() in v.casefold() for v in values]
+        return [OPERATORS[op](v, value) for v in values]
+    if op == '~':
+        raise ValueError('{} is not a text column'.format(name))
+    try:
+        value = parse_number(value)
+    except ValueError:
+        raise ValueError('{} is a number column, not {!r}'.format(name, value))
+    if np is not None:
+        if values.ndim != 1:
+            raise ValueError("{} is an array field and can't be filtered on".format(name))
+        return OPERATORS[op](values, value)
+    try:
+        return [OPERATORS[op](v, value) for v in values]
+    except TypeError:
+        raise ValueError("{} is an array field and can't be filtered on".format(name))
+
+
+def filter_mask(column, conditions):
+    """
+    Rows meeting every condition, as a boolean array with NumPy or a list of bools without.
+    column(name) gives every row's value for a column name, raising KeyError for unknown names.
+    """
+    mask = None
+    for name, op, value in conditions:
+        try:
+            values = column(name)
+        except KeyError:
+            raise ValueError('No column named {}'.format(name))
+        matches = condition_matches(values, name, op, value)
+        if np is not None:
+            matches = np.asarray(matches, dtype=bool)
+            mask = matches if mask is None else mask & matches
+        else:
+            mask = matches if mask is None else [a and b for a, b in zip(mask, matches)]
+    return mask
+
+
+def sort_order(values, descending=False):
+    """
+    Permutation of row indexes putting a column in order. Ties keep their row order,
+    and with NumPy, NaNs go last either way.
+    Rows of array fields are ordered element by element.
+    """
+    if np is not None:
+        values = np.asarray(values)
+        if values.ndim > 1:
+            order = np.lexsort(values.T[::-1])
+        elif descending and values.dtype.kind in 'biuf':
+            # Negate rather than reverse, to keep ties and NaNs in place
+            with np.errstate(invalid='ignore'):  # Signalling NaNs in float fields
+                key = values.astype(np.float64 if values.dtype.kind == 'f' else np.int64)
+            return np.argsort(-key, kind='stable')
+        else:
+            order = np.argsort(values, kind='stable')
+        return order[::-1] if descending else order
+    return sorted(range(len(values)), key=values.__getitem__, reverse=descending)
+
+
+def apply_mask(order, mask):
+    """
+    The rows of a permutation that a filter mask keeps, still in permutation order
+    """
+    if mask is None:
+        return order
+    if np is not None:
+        return order[mask[order]]
+    return [row for row in order if mask[row]]